@@ -1,192 +1,31 @@
-import random
-import math
+import os
+import sys
 import time
-import matplotlib.pyplot as plt # Keep for simulations if run separately
-import numpy as np # Keep for simulations if run separately
-
-# --- 1. Game Environment Setup (Unchanged from previous version) ---
-EMPTY = ' '
-# AI_PLAYER = 'O' # These will be dynamic in the API
-# HUMAN_PLAYER = 'X'
-
-def print_board(board):
-    """Prints the Tic-Tac-Toe board."""
-    print("\n")
-    print(f" {board[0]} | {board[1]} | {board[2]} ")
-    print("---|---|---")
-    print(f" {board[3]} | {board[4]} | {board[5]} ")
-    print("---|---|---")
-    print(f" {board[6]} | {board[7]} | {board[8]} ")
-    print("\n")
-
-def check_winner(board, player):
-    """Checks if the given player has won."""
-    win_conditions = [
-        [0, 1, 2], [3, 4, 5], [6, 7, 8],
-        [0, 3, 6], [1, 4, 7], [2, 5, 8],
-        [0, 4, 8], [2, 4, 6]
-    ]
-    for condition in win_conditions:
-        if all(board[i] == player for i in condition):
-            return True
-    return False
-
-def is_board_full(board):
-    """Checks if the board is full (tie)."""
-    return EMPTY not in board
-
-def get_available_moves(board):
-    """Returns a list of indices of available (empty) moves."""
-    return [i for i, spot in enumerate(board) if spot == EMPTY]
-
-def make_move(board, move, player):
-    """Makes a move on the board. Returns a new board state."""
-    if 0 <= move < 9 and board[move] == EMPTY:
-        new_board = board[:]
-        new_board[move] = player
-        return new_board
-    return None
-
-# --- 2. Minimax Algorithm Implementation (Unchanged) ---
-memo = {}
-
-def minimax(board, depth, is_maximizing_player, alpha, beta, ai_player_symbol, human_player_symbol):
-    board_tuple = tuple(board)
-    if board_tuple in memo: # Check memoization
-        return memo[board_tuple]
-
-    if check_winner(board, ai_player_symbol):
-        result = 10 - depth
-        memo[board_tuple] = result # Store in memo
-        return result
-    if check_winner(board, human_player_symbol):
-        result = depth - 10
-        memo[board_tuple] = result # Store in memo
-        return result
-    if is_board_full(board):
-        memo[board_tuple] = 0 # Store in memo
-        return 0
+from flask import Flask, Response, g, request, jsonify
+from flask_cors import CORS
 
-    available_moves = get_available_moves(board)
-
-    if is_maximizing_player:
-        max_eval = -math.inf
-        for move_idx in available_moves:
-            new_board = make_move(board, move_idx, ai_player_symbol)
-            eval_score = minimax(new_board, depth + 1, False, alpha, beta, ai_player_symbol, human_player_symbol)
-            max_eval = max(max_eval, eval_score)
-            alpha = max(alpha, eval_score)
-            if beta <= alpha:
-                break
-        memo[board_tuple] = max_eval # Store in memo
-        return max_eval
-    else:
-        min_eval = math.inf
-        for move_idx in available_moves:
-            new_board = make_move(board, move_idx, human_player_symbol)
-            eval_score = minimax(new_board, depth + 1, True, alpha, beta, ai_player_symbol, human_player_symbol)
-            min_eval = min(min_eval, eval_score)
-            beta = min(beta, eval_score)
-            if beta <= alpha:
-                break
-        memo[board_tuple] = min_eval # Store in memo
-        return min_eval
-
-# --- 3. AI Player Function (Unchanged) ---
-def find_best_move(board, ai_player_symbol, human_player_symbol):
-    best_score = -math.inf
-    best_move = -1
-    available_moves = get_available_moves(board)
-    random.shuffle(available_moves) # Add some randomness for equally good moves
-
-    # Critical: Clear memo before a new top-level search for a move,
-    # or ensure memoization handles context properly if not cleared.
-    # For API/standalone calls, clearing is safer.
-    memo.clear() 
-                                     
-    for move_idx in available_moves:
-        new_board = make_move(board, move_idx, ai_player_symbol)
-        # Depth starts at 0 for the next state, opponent is not maximizing
-        move_score = minimax(new_board, 0, False, -math.inf, math.inf, ai_player_symbol, human_player_symbol)
-
-        if move_score > best_score:
-            best_score = move_score
-            best_move = move_idx
-            
-    if best_move == -1 and available_moves: # Fallback if all moves are losing, pick one
-        return random.choice(available_moves)
-    return best_move
-
-# --- Simulation and Interactive Play (Original functions, will be called conditionally) ---
-def random_move_agent(board, player_symbol):
-    available_moves = get_available_moves(board)
-    if available_moves:
-        return random.choice(available_moves)
-    return -1
-
-def simulate_games_main(num_games, ai_starts_first, ai_player_char='O', opponent_char='X'):
-    # (This is the simulate_games function from your original script)
-    ai_wins = 0
-    opponent_wins = 0
-    ties = 0
-    print(f"Simulating {num_games} games. AI ({ai_player_char}) vs Random Agent ({opponent_char}). AI starts first: {ai_starts_first}")
-    for i in range(num_games):
-        board = [EMPTY] * 9
-        current_player_is_ai = ai_starts_first
-        game_over = False
-        if (i + 1) % (num_games // 10 if num_games >=10 else 1) == 0:
-            print(f"  Simulating game {i+1}/{num_games}...")
-        while not game_over:
-            if current_player_is_ai:
-                move = find_best_move(board, ai_player_char, opponent_char)
-                board = make_move(board, move, ai_player_char)
-                if check_winner(board, ai_player_char):
-                    ai_wins += 1
-                    game_over = True
-            else:
-                move = random_move_agent(board, opponent_char)
-                if move != -1:
-                    board = make_move(board, move, opponent_char)
-                    if check_winner(board, opponent_char):
-                        opponent_wins += 1
-                        game_over = True
-            if not game_over and is_board_full(board):
-                ties += 1
-                game_over = True
-            current_player_is_ai = not current_player_is_ai
-    return ai_wins, opponent_wins, ties
-
-def run_simulations_and_charts():
-    print("Step 1-3: Game Logic and Minimax AI are defined.")
-    print("\nStep 4: Simulating games to evaluate AI performance...")
-    NUM_SIMULATIONS = 50 # Reduced for quicker demo
-    AI_PLAYER_SYMBOL_SIM = 'O'
-    RANDOM_AGENT_SYMBOL_SIM = 'X'
-
-    ai_wins_first, opp_wins_first, ties_first = simulate_games_main(NUM_SIMULATIONS // 2, True, AI_PLAYER_SYMBOL_SIM, RANDOM_AGENT_SYMBOL_SIM)
-    ai_wins_second, opp_wins_second, ties_second = simulate_games_main(NUM_SIMULATIONS // 2, False, AI_PLAYER_SYMBOL_SIM, RANDOM_AGENT_SYMBOL_SIM)
-
-    total_ai_wins = ai_wins_first + ai_wins_second
-    total_opp_wins = opp_wins_first + opp_wins_second
-    total_ties = ties_first + ties_second
-    total_games = NUM_SIMULATIONS
-
-    print("\n--- Simulation Results ---")
-    print(f"Total Games Played: {total_games}")
-    print(f"AI ({AI_PLAYER_SYMBOL_SIM}) Wins: {total_ai_wins} ({total_ai_wins/total_games*100:.2f}%)")
-    print(f"Random Agent ({RANDOM_AGENT_SYMBOL_SIM}) Wins: {total_opp_wins} ({total_opp_wins/total_games*100:.2f}%)")
-    print(f"Ties: {total_ties} ({total_ties/total_games*100:.2f}%)")
-    if total_games > 0:
-        accuracy = (total_ai_wins + total_ties) / total_games
-        print(f"\nMinimax AI 'Unbeatability' (Wins + Ties vs Random): {accuracy*100:.2f}%")
-
-    labels = [f'AI ({AI_PLAYER_SYMBOL_SIM}) Wins', f'Random ({RANDOM_AGENT_SYMBOL_SIM}) Wins', 'Ties']
-    sizes_total = [total_ai_wins, total_opp_wins, total_ties]
-    fig, ax = plt.subplots(figsize=(7, 7))
-    ax.pie(sizes_total, labels=labels, autopct='%1.1f%%', startangle=90, colors=['skyblue', 'lightcoral', 'lightgreen'])
-    ax.axis('equal')
-    ax.set_title(f'Overall Performance ({total_games} games)')
-    plt.show()
+# The engine lives in engine.py; its public names are re-exported here so
+# existing `from app import ...` code keeps working. Simulation and plotting
+# code lives in simulation.py and is only imported by the 'simulate' and 'charts' modes.
+from engine import (
+    EMPTY, print_board, check_winner, is_board_full, get_available_moves, make_move,
+    minimax, find_best_move, random_move_agent, transposition_table,
+    OPENING_BOOK, OPENING_BOOK_PATH, build_opening_book, load_opening_book, book_move,
+    warm_up_engine, IS_WINNING, find_best_move_bits, book_move_bits, SearchState,
+)
+from nk_engine import (
+    MIN_BOARD_SIZE, MAX_BOARD_SIZE, MAX_BUDGET_MS, DEFAULT_BUDGET_MS, get_geometry, find_best_move_nk,
+    find_best_move_nk_bits,
+)
+from wire import (
+    BINARY_MIMETYPE, STATUS_SUCCESS, STATUS_GAME_OVER, STATUS_ERROR, WINNER_NONE, WINNER_AI, WINNER_OPPONENT,
+    WINNER_TIE, WireFormatError, decode_batch_request, decode_single_request, encode_batch_response,
+    encode_response, request_to_json, result_codes,
+)
+from sessions import SessionConflict, board_of, create_session_store, new_game, play_move
+import nk_engine
+from profiling import install_request_profiling, print_profile
+from metrics import CONTENT_TYPE, NODE_BUCKETS, REGISTRY, Counter, GaugeFunction, Histogram
 
 def play_game_interactive():
     # (This is the play_game function from your original script)
@@ -236,108 +75,316 @@ def play_game_interactive():
         human_turn = not human_turn
 
 # +++ NEW: Flask API Implementation +++
-from flask import Flask, request, jsonify
-from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
 
+# --- Metrics (served by GET /metrics) ---
+REQUESTS = REGISTRY.register(Counter(
+    'ttt_requests_total', "HTTP requests by route, method and status code.", ('route', 'method', 'status')))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'ttt_request_duration_seconds', "Time to handle a request, by route.", ('route',)))
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    'ttt_phase_duration_seconds', "Time spent in each phase of a move request: validation, search and serialization.",
+    ('endpoint', 'phase')))
+SEARCH_NODES = REGISTRY.register(Histogram(
+    'ttt_search_nodes', "Nodes searched per AI move (0 when answered from the opening book or cache).",
+    ('engine',), NODE_BUCKETS))
+GAME_OVER_ON_ARRIVAL = REGISTRY.register(Counter(
+    'ttt_game_over_on_arrival_total', "Move requests for games that were already over, by who had won.", ('winner',)))
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched' # Bounded label values
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route)
+        REQUESTS.inc(route, request.method, str(response.status_code))
+    return response
+
+def _timed_search(endpoint, engine_name, search, *args, nodes_of=None, **kwargs):
+    """Runs `search(*args, **kwargs)` and records its time and the nodes it visited.
+
+    Nodes are counted per search, so concurrent requests don't see each
+    other's: 3x3 searches are given a SearchState to count into, and
+    `nodes_of(result)` reads a larger-board search's count (by default its
+    SearchResult.nodes).
+    """
+    search_state = None
+    if engine_name == '3x3':
+        search_state = kwargs['search_state'] = SearchState()
+    start = time.perf_counter()
+    result = search(*args, **kwargs)
+    PHASE_SECONDS.observe(time.perf_counter() - start, endpoint, 'search')
+    if search_state is not None:
+        nodes = search_state.nodes
+    else:
+        nodes = nodes_of(result) if nodes_of is not None else result.nodes
+    SEARCH_NODES.observe(nodes, engine_name)
+    return result
+
+def _jsonify_timed(endpoint, result):
+    start = time.perf_counter()
+    response = jsonify(result)
+    PHASE_SECONDS.observe(time.perf_counter() - start, endpoint, 'serialization')
+    return response
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _game_settings(data):
+    """Validates the game settings shared by /predict_move and /sessions.
+
+    Returns ((board_size, win_length, budget_ms, ai_symbol, opponent_symbol), None)
+    or (None, error_message).
+    """
+    ai_symbol = data.get('ai_symbol')
+    opponent_symbol = data.get('opponent_symbol')
+    board_size = data.get('board_size', 3)
+    win_length = data.get('win_length', board_size)
+    budget_ms = data.get('budget_ms')
+
+    if not _is_int(board_size) or not MIN_BOARD_SIZE <= board_size <= MAX_BOARD_SIZE:
+        return None, f"Invalid 'board_size' provided. Must be an integer from {MIN_BOARD_SIZE} to {MAX_BOARD_SIZE}."
+    if not _is_int(win_length) or not MIN_BOARD_SIZE <= win_length <= board_size:
+        return None, f"Invalid 'win_length' provided. Must be an integer from {MIN_BOARD_SIZE} to 'board_size'."
+    if budget_ms is not None and (not _is_number(budget_ms) or not 0 < budget_ms <= MAX_BUDGET_MS):
+        return None, f"Invalid 'budget_ms' provided. Must be a number of milliseconds up to {MAX_BUDGET_MS:g}."
+    if not ai_symbol or not isinstance(ai_symbol, str) or len(ai_symbol) != 1:
+        return None, "Invalid 'ai_symbol' provided. Must be a single character string."
+    if not opponent_symbol or not isinstance(opponent_symbol, str) or len(opponent_symbol) != 1:
+        return None, "Invalid 'opponent_symbol' provided. Must be a single character string."
+    if ai_symbol == opponent_symbol:
+        return None, "'ai_symbol' and 'opponent_symbol' cannot be the same."
+    return (board_size, win_length, budget_ms, ai_symbol, opponent_symbol), None
+
+def predict_move_result(data, endpoint='predict_move', allow_search=True, cancel=None):
+    """Validates one /predict_move request body and plays the AI's move.
+
+    Optional 'board_size' (default 3), 'win_length' (default 'board_size') and
+    'budget_ms' select an N x N, k-in-a-row game and the search time budget.
+    Returns (response_dict, http_status) so the same logic serves the single
+    and the batch endpoints; `endpoint` labels the phase timings.
+    With allow_search=False, returns (None, None) instead of running a search
+    (anything but a game-over answer, an opening book move or a 3x3 search
+    once warm_up_engine has filled the table); `cancel` is passed to the
+    larger-board search.
+    """
+    start = time.perf_counter()
+    if not data or not isinstance(data, dict):
+        return {"error": "No input data provided"}, 400
+
+    # --- Input Validation ---
+    settings, error = _game_settings(data)
+    if error:
+        return {"error": error}, 400
+    board_size, win_length, budget_ms, ai_symbol, opponent_symbol = settings
+    board_input = data.get('board')
+    cell_count = board_size * board_size
+    if not board_input or not isinstance(board_input, list) or len(board_input) != cell_count:
+        return {"error": f"Invalid 'board' provided. Must be a list of {cell_count} strings."}, 400
+    if not all(isinstance(s, str) for s in board_input): # Ensure all elements are strings
+        return {"error": "Board elements must be strings (e.g., 'X', 'O', ' ')."}, 400
+
+    # Normalize board: ensure only ai_symbol, opponent_symbol, or EMPTY are present
+    current_board = []
+    for spot in board_input:
+        if spot == ai_symbol:
+            current_board.append(ai_symbol)
+        elif spot == opponent_symbol:
+            current_board.append(opponent_symbol)
+        else: # Treat anything else (e.g. "", null from JSON, or other chars) as EMPTY
+            current_board.append(EMPTY)
+
+
+    PHASE_SECONDS.observe(time.perf_counter() - start, endpoint, 'validation')
+
+    # The classic 3x3 game is solved exactly; larger boards use the budgeted search.
+    solved_game = (board_size, win_length) == (3, 3)
+    has_won = check_winner if solved_game else get_geometry(board_size, win_length).check_winner
+
+    # --- Game State Checks Before AI Moves ---
+    if has_won(current_board, ai_symbol):
+        GAME_OVER_ON_ARRIVAL.inc('ai')
+        return {
+            "board": current_board, "ai_move_index": None, "status": "game_over",
+            "message": f"Game already over. AI ({ai_symbol}) had already won.",
+            "game_over": True, "winner": ai_symbol
+        }, 200
+    if has_won(current_board, opponent_symbol):
+        GAME_OVER_ON_ARRIVAL.inc('opponent')
+        return {
+            "board": current_board, "ai_move_index": None, "status": "game_over",
+            "message": f"Game already over. Opponent ({opponent_symbol}) had already won.",
+            "game_over": True, "winner": opponent_symbol
+        }, 200
+    if is_board_full(current_board): # Check if board is full and no winner
+        GAME_OVER_ON_ARRIVAL.inc('tie')
+        return {
+            "board": current_board, "ai_move_index": None, "status": "game_over",
+            "message": "Game already over. It's a tie.",
+            "game_over": True, "winner": "tie"
+        }, 200
+    if not get_available_moves(current_board): # Should be caught by is_board_full
+         return {
+            "board": current_board, "ai_move_index": None, "status": "game_over",
+            "message": "Board is full, no moves possible. It's a tie.",
+            "game_over": True, "winner": "tie"
+        }, 200
+
+
+    # --- AI Makes a Move ---
+    search_info = None
+    if solved_game:
+        # Read from the opening book when it is built, otherwise searched.
+        if allow_search or transposition_table.warm:
+            ai_move_index = _timed_search(endpoint, '3x3', find_best_move, current_board, ai_symbol, opponent_symbol)
+        else:
+            ai_move_index = book_move(current_board, ai_symbol, opponent_symbol)
+            if ai_move_index is None:
+                return None, None
+    else:
+        if not allow_search:
+            return None, None
+        result = _timed_search(endpoint, 'nk', find_best_move_nk, current_board, ai_symbol, opponent_symbol,
+                               board_size, win_length, budget_ms, cancel=cancel)
+        ai_move_index = result.move
+        search_info = {"depth": result.depth, "nodes": result.nodes,
+                       "elapsed_ms": round(result.elapsed_ms, 2), "complete": result.complete}
+
+    if ai_move_index == -1 : # Should only happen if no available moves, handled above.
+         # This case suggests an issue if reached when moves are available
+         return {"error": "AI could not determine a move, board might be in an unexpected state.", 
+                         "board": current_board}, 500
+
+    new_board_state = make_move(current_board, ai_move_index, ai_symbol)
+    if new_board_state is None: # Should not happen if ai_move_index is valid
+        return {"error": "AI generated an invalid move index.", "board": current_board, "ai_move_index_attempted": ai_move_index}, 500
+
+
+    # --- Check Game State After AI's Move ---
+    game_over_after_ai = False
+    winner_after_ai = None
+    message_after_ai = f"AI ({ai_symbol}) moved to position {ai_move_index}."
+
+    if has_won(new_board_state, ai_symbol):
+        game_over_after_ai = True
+        winner_after_ai = ai_symbol
+        message_after_ai = f"AI ({ai_symbol}) moved to {ai_move_index} and won!"
+    elif is_board_full(new_board_state): # Check for tie only if AI didn't win
+        game_over_after_ai = True
+        winner_after_ai = "tie" # Represent tie as 'tie'
+        message_after_ai = f"AI ({ai_symbol}) moved to {ai_move_index}. It's a tie!"
+
+    response = {
+        "board": new_board_state, # Use "board" to be consistent with input
+        "ai_move_index": ai_move_index,
+        "status": "success",
+        "message": message_after_ai,
+        "game_over": game_over_after_ai,
+        "winner": winner_after_ai # Will be ai_symbol, 'tie', or None
+    }
+    if search_info is not None: # Larger boards: how deep the budgeted search got
+        response["search"] = search_info
+    return response, 200
+
+
+def predict_move_codes(req, endpoint='predict_move', allow_search=True, cancel=None):
+    """predict_move_result for a decoded binary request (see wire.py).
+
+    Works on the request's bitboards directly, without building and
+    normalizing a list board. Returns (status, move, winner) codes, or None
+    when allow_search=False and the answer needs a search (as in
+    predict_move_result).
+    """
+    size, win_length, ai_bits, opp_bits = req.board_size, req.win_length, req.ai_bits, req.opp_bits
+    full = (1 << size * size) - 1
+    solved_game = (size, win_length) == (3, 3)
+    geometry = None if solved_game else get_geometry(size, win_length)
+    has_won = IS_WINNING.__getitem__ if solved_game else geometry.has_won
+
+    if has_won(ai_bits):
+        GAME_OVER_ON_ARRIVAL.inc('ai')
+        return STATUS_GAME_OVER, None, WINNER_AI
+    if has_won(opp_bits):
+        GAME_OVER_ON_ARRIVAL.inc('opponent')
+        return STATUS_GAME_OVER, None, WINNER_OPPONENT
+    if ai_bits | opp_bits == full:
+        GAME_OVER_ON_ARRIVAL.inc('tie')
+        return STATUS_GAME_OVER, None, WINNER_TIE
+
+    if solved_game:
+        if allow_search or transposition_table.warm:
+            move = _timed_search(endpoint, '3x3', find_best_move_bits, ai_bits, opp_bits)
+        else:
+            move = book_move_bits(ai_bits, opp_bits)
+            if move is None:
+                return None
+        won = IS_WINNING[ai_bits | 1 << move]
+    else:
+        if not allow_search:
+            return None
+        move = _timed_search(endpoint, 'nk', find_best_move_nk_bits, ai_bits, opp_bits, size, win_length,
+                             req.budget_ms, cancel=cancel).move
+        won = geometry.is_win_after(ai_bits | 1 << move, move)
+    if won:
+        return STATUS_SUCCESS, move, WINNER_AI
+    if ai_bits | opp_bits | 1 << move == full:
+        return STATUS_SUCCESS, move, WINNER_TIE
+    return STATUS_SUCCESS, move, WINNER_NONE
+
+def negotiate_binary(accept_mimetypes, request_is_binary):
+    """Content negotiation: the response uses the request's format unless the
+    Accept header (a werkzeug MIMEAccept) prefers the other one."""
+    offered = (BINARY_MIMETYPE, 'application/json') if request_is_binary else ('application/json', BINARY_MIMETYPE)
+    best = accept_mimetypes.best_match(offered)
+    return best == BINARY_MIMETYPE if best is not None else request_is_binary
+
+def _wants_binary(request_is_binary):
+    return negotiate_binary(request.accept_mimetypes, request_is_binary)
+
+def _binary_response(endpoint, encode, *args, status=200):
+    start = time.perf_counter()
+    response = Response(encode(*args), status=status, content_type=BINARY_MIMETYPE)
+    PHASE_SECONDS.observe(time.perf_counter() - start, endpoint, 'serialization')
+    return response
+
 @app.route('/predict_move', methods=['POST'])
 def predict_move_api():
+    """Accepts and answers JSON (the default) or the binary format in wire.py,
+    chosen by the Content-Type and Accept headers."""
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "No input data provided"}), 400
-
-        board_input = data.get('board')
-        ai_symbol = data.get('ai_symbol')
-        opponent_symbol = data.get('opponent_symbol')
-
-        # --- Input Validation ---
-        if not board_input or not isinstance(board_input, list) or len(board_input) != 9:
-            return jsonify({"error": "Invalid 'board' provided. Must be a list of 9 strings."}), 400
-        if not all(isinstance(s, str) for s in board_input): # Ensure all elements are strings
-            return jsonify({"error": "Board elements must be strings (e.g., 'X', 'O', ' ')."}), 400
-        if not ai_symbol or not isinstance(ai_symbol, str) or len(ai_symbol) != 1:
-            return jsonify({"error": "Invalid 'ai_symbol' provided. Must be a single character string."}), 400
-        if not opponent_symbol or not isinstance(opponent_symbol, str) or len(opponent_symbol) != 1:
-            return jsonify({"error": "Invalid 'opponent_symbol' provided. Must be a single character string."}), 400
-        if ai_symbol == opponent_symbol:
-            return jsonify({"error": "'ai_symbol' and 'opponent_symbol' cannot be the same."}), 400
-        
-        # Normalize board: ensure only ai_symbol, opponent_symbol, or EMPTY are present
-        current_board = []
-        for spot in board_input:
-            if spot == ai_symbol:
-                current_board.append(ai_symbol)
-            elif spot == opponent_symbol:
-                current_board.append(opponent_symbol)
-            else: # Treat anything else (e.g. "", null from JSON, or other chars) as EMPTY
-                current_board.append(EMPTY)
-
-
-        # --- Game State Checks Before AI Moves ---
-        if check_winner(current_board, ai_symbol):
-            return jsonify({
-                "board": current_board, "ai_move_index": None, "status": "game_over",
-                "message": f"Game already over. AI ({ai_symbol}) had already won.",
-                "game_over": True, "winner": ai_symbol
-            }), 200
-        if check_winner(current_board, opponent_symbol):
-            return jsonify({
-                "board": current_board, "ai_move_index": None, "status": "game_over",
-                "message": f"Game already over. Opponent ({opponent_symbol}) had already won.",
-                "game_over": True, "winner": opponent_symbol
-            }), 200
-        if is_board_full(current_board): # Check if board is full and no winner
-            return jsonify({
-                "board": current_board, "ai_move_index": None, "status": "game_over",
-                "message": "Game already over. It's a tie.",
-                "game_over": True, "winner": "tie"
-            }), 200
-        if not get_available_moves(current_board): # Should be caught by is_board_full
-             return jsonify({
-                "board": current_board, "ai_move_index": None, "status": "game_over",
-                "message": "Board is full, no moves possible. It's a tie.",
-                "game_over": True, "winner": "tie"
-            }), 200
-
-
-        # --- AI Makes a Move ---
-        ai_move_index = find_best_move(current_board, ai_symbol, opponent_symbol)
-
-        if ai_move_index == -1 : # Should only happen if no available moves, handled above.
-             # This case suggests an issue if reached when moves are available
-             return jsonify({"error": "AI could not determine a move, board might be in an unexpected state.", 
-                             "board": current_board}), 500
-
-        new_board_state = make_move(current_board, ai_move_index, ai_symbol)
-        if new_board_state is None: # Should not happen if ai_move_index is valid
-            return jsonify({"error": "AI generated an invalid move index.", "board": current_board, "ai_move_index_attempted": ai_move_index}), 500
-
-
-        # --- Check Game State After AI's Move ---
-        game_over_after_ai = False
-        winner_after_ai = None
-        message_after_ai = f"AI ({ai_symbol}) moved to position {ai_move_index}."
-
-        if check_winner(new_board_state, ai_symbol):
-            game_over_after_ai = True
-            winner_after_ai = ai_symbol
-            message_after_ai = f"AI ({ai_symbol}) moved to {ai_move_index} and won!"
-        elif is_board_full(new_board_state): # Check for tie only if AI didn't win
-            game_over_after_ai = True
-            winner_after_ai = "tie" # Represent tie as 'tie'
-            message_after_ai = f"AI ({ai_symbol}) moved to {ai_move_index}. It's a tie!"
-
-        return jsonify({
-            "board": new_board_state, # Use "board" to be consistent with input
-            "ai_move_index": ai_move_index,
-            "status": "success",
-            "message": message_after_ai,
-            "game_over": game_over_after_ai,
-            "winner": winner_after_ai # Will be ai_symbol, 'tie', or None
-        }), 200
+        if request.mimetype == BINARY_MIMETYPE:
+            start = time.perf_counter()
+            try:
+                req = decode_single_request(request.get_data())
+            except WireFormatError as e:
+                req = e
+            if isinstance(req, WireFormatError):
+                if _wants_binary(True):
+                    return _binary_response('predict_move', encode_response, STATUS_ERROR, None, WINNER_NONE, str(req),
+                                            status=400)
+                return jsonify({"error": str(req)}), 400
+            PHASE_SECONDS.observe(time.perf_counter() - start, 'predict_move', 'validation')
+            if _wants_binary(True): # Fast path: bitboards in, codes out
+                return _binary_response('predict_move', encode_response, *predict_move_codes(req))
+            data = request_to_json(req)
+        else:
+            data = request.get_json()
+
+        result, status_code = predict_move_result(data)
+        if _wants_binary(False):
+            message = result.get("error", "") if status_code != 200 else ''
+            codes = result_codes(result, data.get('ai_symbol') if isinstance(data, dict) else None)
+            return _binary_response('predict_move', encode_response, *codes, message, status=status_code)
+        return _jsonify_timed('predict_move', result), status_code
 
     except Exception as e:
         # Log the exception for debugging
@@ -347,31 +394,488 @@ def predict_move_api():
         return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
 
 
+MAX_BATCH_SIZE = int(os.environ.get('TTT_MAX_BATCH_SIZE', 1000))
+
+@app.route('/predict_moves', methods=['POST'])
+def predict_moves_api():
+    """Batch version of /predict_move for services that run many games at once.
+
+    Takes {"items": [{board, ai_symbol, opponent_symbol}, ...]} and returns
+    {"results": [...]} in the same order, each result shaped like a
+    /predict_move response. A bad item gets its own {"error": ...} result
+    instead of failing the whole batch. Identical items are solved once.
+    Like /predict_move, it also speaks the binary format in wire.py.
+    """
+    try:
+        request_is_binary = request.mimetype == BINARY_MIMETYPE
+        if request_is_binary:
+            try:
+                requests = decode_batch_request(request.get_data())
+            except WireFormatError as e:
+                return jsonify({"error": str(e)}), 400
+            if len(requests) > MAX_BATCH_SIZE:
+                return jsonify({"error": f"Too many items in batch. Maximum is {MAX_BATCH_SIZE}."}), 400
+            if _wants_binary(True):
+                return _binary_response('predict_moves', encode_batch_response, _solve_binary_items(requests))
+            items = [req if isinstance(req, WireFormatError) else request_to_json(req) for req in requests]
+        else:
+            data = request.get_json()
+            items = data.get('items') if isinstance(data, dict) else None
+            if not isinstance(items, list):
+                return jsonify({"error": "Invalid input. Expected {\"items\": [...]}."}), 400
+            if len(items) > MAX_BATCH_SIZE:
+                return jsonify({"error": f"Too many items in batch. Maximum is {MAX_BATCH_SIZE}."}), 400
+
+        results = _solve_json_items(items)
+        if _wants_binary(request_is_binary):
+            codes = [result_codes(result, item.get('ai_symbol') if isinstance(item, dict) else None)
+                     for item, result in zip(items, results)]
+            return _binary_response('predict_moves', encode_batch_response, codes)
+        return _jsonify_timed('predict_moves', {"results": results, "status": "success"}), 200
+
+    except Exception as e:
+        app.logger.error(f"Error in /predict_moves: {str(e)}")
+        import traceback
+        app.logger.error(traceback.format_exc())
+        return jsonify({"error": "An internal server error occurred.", "details": str(e)}), 500
+
+DEADLINE_ERROR = "Search did not finish before the deadline."
+
+def _cap_budget(data, budget_ms):
+    """A copy of a JSON request body with its search budget cut to at most
+    `budget_ms`; invalid values are left for validation to report."""
+    if not isinstance(data, dict):
+        return data
+    budget = data.get('budget_ms')
+    if budget is not None and (not _is_number(budget) or not 0 < budget <= MAX_BUDGET_MS):
+        return data
+    return dict(data, budget_ms=min(budget or DEFAULT_BUDGET_MS, budget_ms))
+
+def _batch_time_left_ms(cancel, deadline):
+    """Milliseconds left for the next batch item's search (None without a
+    deadline), or 0 once the batch is cancelled or out of time."""
+    if cancel is not None and cancel.is_set():
+        return 0
+    if deadline is None:
+        return None
+    return max((deadline - time.monotonic()) * 1000, 0)
+
+def _solve_binary_items(requests, cancel=None, deadline=None):
+    """(status, move, winner) codes for decoded binary batch items.
+
+    `cancel` and `deadline` work as in _solve_json_items.
+    """
+    codes = []
+    solved = {} # Duplicate items within the batch share one result
+    for index, req in enumerate(requests):
+        if isinstance(req, WireFormatError):
+            codes.append((STATUS_ERROR, None, WINNER_NONE))
+            continue
+        if req not in solved:
+            left_ms = _batch_time_left_ms(cancel, deadline)
+            if left_ms == 0:
+                codes.append((STATUS_ERROR, None, WINNER_NONE))
+                continue
+            if left_ms is not None: # An equal share of the time left for each remaining item
+                share_ms = left_ms / (len(requests) - index)
+                capped = req._replace(budget_ms=min(req.budget_ms or DEFAULT_BUDGET_MS, share_ms))
+            else:
+                capped = req
+            try:
+                solved[req] = predict_move_codes(capped, 'predict_moves', cancel=cancel)
+            except Exception as e:
+                app.logger.error(f"Error in /predict_moves item: {str(e)}")
+                solved[req] = (STATUS_ERROR, None, WINNER_NONE)
+        codes.append(solved[req])
+    return codes
+
+def _batch_key(item):
+    """Dedupe key for a JSON batch item, or None if it is not worth keying.
+
+    Items with equal keys are the same request once defaults are applied
+    (a missing 'board_size' is 3, a missing 'win_length' is 'board_size')
+    and the board is normalized. Settings are keyed with their types, so
+    e.g. 3 and 3.0 (valid and invalid) never share a result.
+    """
+    if not isinstance(item, dict):
+        return None
+    board = item.get('board')
+    if not isinstance(board, list) or not all(isinstance(spot, str) for spot in board):
+        return None
+    ai_symbol, opponent_symbol = item.get('ai_symbol'), item.get('opponent_symbol')
+    board_size = item.get('board_size', 3)
+    settings = (ai_symbol, opponent_symbol, board_size, item.get('win_length', board_size), item.get('budget_ms'))
+    if not all(value is None or type(value) in (str, int, float, bool) for value in settings):
+        return None
+    cells = tuple(spot if spot in (ai_symbol, opponent_symbol) else EMPTY for spot in board)
+    return (cells,) + tuple((type(value), value) for value in settings)
+
+def _solve_json_items(items, cancel=None, deadline=None):
+    """/predict_move results for JSON batch items, in order. Binary items
+    that failed to decode arrive as their WireFormatError.
+
+    With a `deadline` (a time.monotonic() value), each item's search budget
+    is cut to an equal share of the time left over the remaining items.
+    `cancel` (anything with `is_set()`) is passed to the searches. Once it
+    is set or the deadline has passed, the remaining items are not searched
+    and get an error.
+    """
+    results = []
+    solved = {} # Duplicate items within the batch share one result
+    for index, item in enumerate(items):
+        if isinstance(item, WireFormatError):
+            results.append({"error": str(item)})
+            continue
+        key = _batch_key(item)
+        if key is not None and key in solved:
+            results.append(solved[key])
+            continue
+        left_ms = _batch_time_left_ms(cancel, deadline)
+        if left_ms == 0:
+            results.append({"error": DEADLINE_ERROR})
+            continue
+        try:
+            if left_ms is not None: # An equal share of the time left for each remaining item
+                item = _cap_budget(item, left_ms / (len(items) - index))
+            result, _ = predict_move_result(item, 'predict_moves', cancel=cancel)
+        except Exception as e:
+            app.logger.error(f"Error in /predict_moves item: {str(e)}")
+            result = {"error": "An internal server error occurred.", "details": str(e)}
+        if key is not None:
+            solved[key] = result
+        results.append(result)
+    return results
+
+
+# --- Game Sessions ---
+# The server keeps the game, so clients only send their next move.
+session_store = create_session_store()
+
+def _session_response(session_id, state, ai_move=None, search_info=None):
+    if state.winner is None:
+        message = f"AI ({state.ai_symbol}) moved to position {ai_move}." if ai_move is not None else "Your move."
+    elif state.winner == 'tie':
+        message = "It's a tie!"
+    elif state.winner == state.ai_symbol:
+        message = (f"AI ({state.ai_symbol}) moved to {ai_move} and won!" if ai_move is not None
+                   else f"AI ({state.ai_symbol}) won!")
+    else:
+        message = f"Opponent ({state.opponent_symbol}) won!"
+    response = {
+        "session_id": session_id, "board": board_of(state), "ai_move_index": ai_move, "status": "success",
+        "message": message, "game_over": state.winner is not None, "winner": state.winner,
+        "board_size": state.board_size, "win_length": state.win_length,
+        "ai_symbol": state.ai_symbol, "opponent_symbol": state.opponent_symbol,
+    }
+    if search_info is not None:
+        response["search"] = search_info
+    return response
+
+@app.route('/sessions', methods=['POST'])
+def create_session_api():
+    """Starts a game kept on the server.
+
+    Takes the /predict_move settings without the board (ai_symbol,
+    opponent_symbol and optionally board_size, win_length, budget_ms) plus an
+    optional 'ai_starts' (default false). Returns the game with its
+    'session_id'; the AI has already moved if it starts.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
+        return jsonify({"error": "No input data provided"}), 400
+    settings, error = _game_settings(data)
+    if error:
+        return jsonify({"error": error}), 400
+    ai_starts = data.get('ai_starts', False)
+    if not isinstance(ai_starts, bool):
+        return jsonify({"error": "Invalid 'ai_starts' provided. Must be true or false."}), 400
+    board_size, win_length, budget_ms, ai_symbol, opponent_symbol = settings
+    state, ai_move, search_info = new_game(board_size, win_length, ai_symbol, opponent_symbol, budget_ms, ai_starts)
+    session_id = session_store.create(state)
+    return jsonify(_session_response(session_id, state, ai_move, search_info)), 201
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+def get_session_api(session_id):
+    state = session_store.get(session_id)
+    if state is None:
+        return jsonify({"error": "Unknown or expired session."}), 404
+    return jsonify(_session_response(session_id, state)), 200
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session_api(session_id):
+    if not session_store.delete(session_id):
+        return jsonify({"error": "Unknown or expired session."}), 404
+    return jsonify({"status": "success"}), 200
+
+@app.route('/sessions/<session_id>/moves', methods=['POST'])
+def play_session_move_api(session_id):
+    """Plays the opponent's {"move": index} and the AI's reply."""
+    start = time.perf_counter()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'move' not in data:
+        return jsonify({"error": "Invalid input. Expected {\"move\": <cell index>}."}), 400
+    state = session_store.get(session_id)
+    if state is None:
+        return jsonify({"error": "Unknown or expired session."}), 404
+    PHASE_SECONDS.observe(time.perf_counter() - start, 'session_move', 'validation')
+    if state.winner is not None:
+        GAME_OVER_ON_ARRIVAL.inc('tie' if state.winner == 'tie' else 'ai' if state.winner == state.ai_symbol else 'opponent')
+    engine_name = '3x3' if (state.board_size, state.win_length) == (3, 3) else 'nk'
+    try:
+        new_state, ai_move, search_info = _timed_search('session_move', engine_name, play_move, state, data['move'],
+                                                        nodes_of=lambda result: (result[2] or {}).get("nodes", 0))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        session_store.update(session_id, new_state, state.ply)
+    except KeyError:
+        return jsonify({"error": "Unknown or expired session."}), 404
+    except SessionConflict:
+        return jsonify({"error": "The game was updated by another request. Fetch it and retry."}), 409
+    return _jsonify_timed('session_move', _session_response(session_id, new_state, ai_move, search_info)), 200
+
+
+def cache_stats():
+    """Stats of this process's transposition tables, by engine."""
+    return {"3x3": transposition_table.stats(), "nk": nk_engine.nk_transposition_table.stats()}
+
+# Where the cache gauges read table stats from. The async server points it at
+# the tables of its search workers, where its searches run.
+cache_stats_source = cache_stats
+
+def _cache_samples(field):
+    stats = cache_stats_source()
+    samples = [((engine_name,), stats[engine_name][field]) for engine_name in ("3x3", "nk")]
+    return [(labels, value) for labels, value in samples if value is not None]
+
+REGISTRY.register(GaugeFunction('ttt_cache_entries', "Entries in the search transposition tables.",
+                                ('engine',), lambda: _cache_samples('size')))
+REGISTRY.register(GaugeFunction('ttt_cache_hits_total', "Transposition table hits.",
+                                ('engine',), lambda: _cache_samples('hits'), 'counter'))
+REGISTRY.register(GaugeFunction('ttt_cache_misses_total', "Transposition table misses.",
+                                ('engine',), lambda: _cache_samples('misses'), 'counter'))
+REGISTRY.register(GaugeFunction('ttt_cache_hit_ratio', "Transposition table hits / lookups since start.",
+                                ('engine',), lambda: _cache_samples('hit_rate')))
+REGISTRY.register(GaugeFunction('ttt_sessions_active', "Game sessions that have not expired.",
+                                (), lambda: [((), session_store.stats()["active"])]))
+
+# Opt-in request profiling (TTT_PROFILING); installs nothing when off.
+request_profiler = install_request_profiling(app)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_api():
+    """Prometheus text exposition of the metrics above."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/engine_stats', methods=['GET'])
+def engine_stats_api():
+    """Reports transposition table usage (size, hits, misses, evictions) and active sessions."""
+    return jsonify({"transposition_table": transposition_table.stats(), "sessions": session_store.stats()}), 200
+
+
+# --- Production Serving (gunicorn) ---
+def run_production_server(bind, workers, timeout=30, graceful_timeout=30):
+    """Serves the API with gunicorn: several worker processes, debug off.
+
+    The app is loaded once in the master before the workers fork, so every
+    worker shares the memory-mapped opening book (or, without a book, a
+    transposition table warmed up in the master, shared copy-on-write) and
+    never pays a warm-up cost while serving.
+    On SIGTERM, workers finish in-flight requests for up to `graceful_timeout`
+    seconds before exiting.
+    The in-memory session store is per process, so with several workers the
+    sessions move to SQLite unless TTT_SESSION_STORE=memory was asked for,
+    in which case the server refuses to start.
+    """
+    global session_store
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("The 'serve' mode requires gunicorn (Linux/macOS): pip install gunicorn")
+        raise SystemExit(1)
+
+    class StandaloneApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    if OPENING_BOOK is not None:
+        print(f"Opening book mapped from {OPENING_BOOK_PATH}, workers share it and need no warm-up.")
+    else:
+        print("No opening book (run build_book), warming up the search engine instead...")
+        stats = warm_up_engine()
+        print(f"Engine ready: {stats['size']} positions in the transposition table.")
+    if workers > 1 and session_store.backend == 'memory':
+        if 'TTT_SESSION_STORE' in os.environ:
+            print(f"TTT_SESSION_STORE=memory keeps each game in one worker process, so with {workers} workers "
+                  "most session requests would get 404. Use TTT_SESSION_STORE=sqlite or --workers 1.")
+            raise SystemExit(1)
+        session_store = create_session_store('sqlite')
+        print(f"Sessions: {workers} workers need a shared store, using SQLite at {session_store.path} "
+              "(set TTT_SESSION_STORE to choose).")
+    app.debug = False
+    options = {
+        "bind": bind,
+        "workers": workers,
+        "preload_app": True,
+        "timeout": timeout,
+        "graceful_timeout": graceful_timeout,
+    }
+    print(f"Starting production server on {bind} with {workers} worker(s) ...")
+    StandaloneApplication(app, options).run()
+
+
+def run_mode(argv):
+    """Runs one command-line mode; `argv` is the mode name followed by its arguments."""
+    if argv[0] == 'interactive':
+        print("Starting interactive game mode...")
+        play_game_interactive()
+    elif argv[0] == 'simulate':
+        import argparse
+        parser = argparse.ArgumentParser(prog=f"{sys.argv[0]} simulate")
+        parser.add_argument('--games', type=int, default=50, help="Number of games to simulate (default: 50).")
+        parser.add_argument('--workers', type=int, default=1, help="Number of worker processes (default: 1).")
+        parser.add_argument('--seed', type=int, default=None,
+                            help="Seed for a reproducible run (same seed and workers give the same results).")
+        parser.add_argument('--vectorized', action='store_true',
+                            help="Play games in NumPy batches using the solved move table.")
+        parser.add_argument('--stream', metavar='FILE',
+                            help="Write one record per game to FILE as games are played, without drawing charts "
+                                 "(run the 'charts' mode on FILE afterwards).")
+        parser.add_argument('--format', choices=('ndjson', 'csv'), default=None,
+                            help="Format of the --stream file (default: csv for a .csv file, otherwise ndjson).")
+        parser.add_argument('--progress-seconds', type=float, default=5.0,
+                            help="Seconds between progress lines while streaming (default: 5, 0 for none).")
+        sim_args = parser.parse_args(argv[1:])
+        if sim_args.games < 1:
+            parser.error("--games must be at least 1")
+        if sim_args.workers < 1:
+            parser.error("--workers must be at least 1")
+        if sim_args.stream and sim_args.vectorized:
+            parser.error("--stream records every move, so it cannot be combined with --vectorized")
+        if sim_args.format and not sim_args.stream:
+            parser.error("--format only applies with --stream")
+        print("Starting simulation mode...")
+        if sim_args.stream:
+            from simulation import stream_simulation
+            summary = stream_simulation(sim_args.games, sim_args.stream, sim_args.format, sim_args.workers,
+                                        sim_args.seed, sim_args.progress_seconds)
+            print(f"Seed: {summary['seed']} (workers: {summary['workers']})")
+            print(f"{summary['games']} game records written to {summary['path']} ({summary['format']}). "
+                  f"Draw charts with: {sys.argv[0]} charts {summary['path']}")
+        else:
+            from simulation import run_simulations_and_charts
+            run_simulations_and_charts(sim_args.games, sim_args.vectorized, sim_args.workers, sim_args.seed)
+    elif argv[0] == 'charts':
+        import argparse
+        parser = argparse.ArgumentParser(prog=f"{sys.argv[0]} charts",
+                                         description="Draws simulation charts from a 'simulate --stream' file.")
+        parser.add_argument('input', help="The NDJSON or CSV file written by 'simulate --stream'.")
+        parser.add_argument('--output', default='simulation_charts.png',
+                            help="Image to write (default: simulation_charts.png).")
+        parser.add_argument('--show', action='store_true', help="Also open the charts in a window.")
+        chart_args = parser.parse_args(argv[1:])
+        from simulation import charts_from_stream
+        charts_from_stream(chart_args.input, chart_args.output, chart_args.show)
+    elif argv[0] == 'build_book':
+        print(f"Solving all positions, verifying them against minimax and writing {OPENING_BOOK_PATH} ...")
+        count = build_opening_book()
+        print(f"Done. {count} positions written and verified.")
+    elif argv[0] == 'serve':
+        import argparse
+        parser = argparse.ArgumentParser(prog=f"{sys.argv[0]} serve")
+        parser.add_argument('--bind', default=os.environ.get('TTT_BIND', '127.0.0.1:5000'),
+                            help="Address to listen on (default: $TTT_BIND or 127.0.0.1:5000).")
+        parser.add_argument('--workers', type=int, default=int(os.environ.get('TTT_WORKERS', os.cpu_count() or 1)),
+                            help="Number of worker processes (default: $TTT_WORKERS or the CPU count).")
+        parser.add_argument('--timeout', type=int, default=30, help="Seconds before a stuck worker is restarted.")
+        parser.add_argument('--graceful-timeout', type=int, default=30,
+                            help="Seconds workers get to finish in-flight requests on shutdown.")
+        serve_args = parser.parse_args(argv[1:])
+        if serve_args.workers < 1:
+            parser.error("--workers must be at least 1")
+        run_production_server(serve_args.bind, serve_args.workers, serve_args.timeout, serve_args.graceful_timeout)
+    elif argv[0] == 'serve_async':
+        import argparse
+        parser = argparse.ArgumentParser(prog=f"{sys.argv[0]} serve_async")
+        parser.add_argument('--bind', default=os.environ.get('TTT_BIND', '127.0.0.1:5000'),
+                            help="Address to listen on (default: $TTT_BIND or 127.0.0.1:5000).")
+        parser.add_argument('--workers', type=int, default=int(os.environ.get('TTT_WORKERS', os.cpu_count() or 1)),
+                            help="Number of search worker processes (default: $TTT_WORKERS or the CPU count).")
+        parser.add_argument('--max-pending', type=int, default=None,
+                            help="Searches allowed to queue or run at once before requests get 503 (default: 4 per worker).")
+        async_args = parser.parse_args(argv[1:])
+        if async_args.workers < 1:
+            parser.error("--workers must be at least 1")
+        from async_server import run_async_server
+        run_async_server(async_args.bind, async_args.workers, async_args.max_pending)
+    elif argv[0] == 'api':
+        print("Starting Flask API server for Tic-Tac-Toe AI on http://127.0.0.1:5000/predict_move ...")
+        app.run(debug=True, port=5000) # Use a different port if 5000 is common
+    elif argv[0] == 'profile':
+        import argparse
+        import cProfile
+        parser = argparse.ArgumentParser(prog=f"{sys.argv[0]} profile",
+                                         description="Runs another mode under cProfile, e.g. 'profile simulate --games 200'.")
+        parser.add_argument('--output', help="Where to write the pstats profile (default: <mode>.prof).")
+        parser.add_argument('--sort', default='cumulative', help="Sort order of the printed summary (default: cumulative).")
+        parser.add_argument('--limit', type=int, default=25, help="Functions to print (default: 25).")
+        parser.add_argument('mode', help="The mode to profile.")
+        parser.add_argument('mode_args', nargs=argparse.REMAINDER, help="Arguments for the mode.")
+        profile_args = parser.parse_args(argv[1:])
+        if profile_args.mode in ('profile', 'api', 'serve', 'serve_async'):
+            parser.error(f"cannot profile the '{profile_args.mode}' mode; set TTT_PROFILING to profile requests")
+        # Don't block on chart windows; the charts are still drawn. Only this
+        # process is profiled, so --workers above 1 hides the games' cost.
+        os.environ.setdefault('MPLBACKEND', 'Agg')
+        output = profile_args.output or f"{profile_args.mode}.prof"
+        profile = cProfile.Profile()
+        profile.runcall(run_mode, [profile_args.mode] + profile_args.mode_args)
+        profile.dump_stats(output)
+        print_profile(profile, profile_args.sort, profile_args.limit)
+        print(f"Profile written to {output} (open it with: python -m pstats {output})")
+    else:
+        print(f"Unknown command: {argv[0]}. Use 'interactive', 'simulate', 'charts', 'build_book', 'api', 'serve', 'serve_async' or 'profile'.")
+
 if __name__ == "__main__":
     # To run simulations and interactive play:
     # python your_script_name.py interactive
-    # python your_script_name.py simulate
+    # python your_script_name.py simulate [--games N] [--workers W] [--seed S] [--vectorized]
+    #
+    # To stream per-game records to a file (headless), then chart them:
+    # python your_script_name.py simulate --games N --stream games.ndjson [--progress-seconds S]
+    # python your_script_name.py charts games.ndjson [--output charts.png]
+    #
+    # To precompute the opening book used by /predict_move:
+    # python your_script_name.py build_book
     #
     # To run the Flask API server:
     # python your_script_name.py api
+    #
+    # To run the API in production (gunicorn, several workers, no debug):
+    # python your_script_name.py serve [--bind HOST:PORT] [--workers N]
+    #
+    # To run the asyncio front end (searches in a bounded process pool):
+    # python your_script_name.py serve_async [--bind HOST:PORT] [--workers N] [--max-pending M]
+    #
+    # To profile another mode (writes a pstats file and prints a summary):
+    # python your_script_name.py profile [--output FILE] simulate [--games N] ...
     # OR (if no arg given, default to API):
     # python your_script_name.py
 
-    import sys
     if len(sys.argv) > 1:
-        if sys.argv[1] == 'interactive':
-            print("Starting interactive game mode...")
-            play_game_interactive()
-        elif sys.argv[1] == 'simulate':
-            print("Starting simulation mode...")
-            run_simulations_and_charts()
-        elif sys.argv[1] == 'api':
-            print("Starting Flask API server for Tic-Tac-Toe AI on http://127.0.0.1:5000/predict_move ...")
-            app.run(debug=True, port=5000) # Use a different port if 5000 is common
-        else:
-            print(f"Unknown command: {sys.argv[1]}. Use 'interactive', 'simulate', or 'api'.")
+        run_mode(sys.argv[1:])
     else:
         # Default action: run the API server
         print("No mode specified, starting Flask API server by default.")
         print("Starting Flask API server for Tic-Tac-Toe AI on http://127.0.0.1:5000/predict_move ...")
-        app.run(debug=True, port=5000)
\ No newline at end of file
+        app.run(debug=True, port=5000)
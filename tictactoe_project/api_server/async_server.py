@@ -0,0 +1,385 @@
+# api_server/async_server.py
+# asyncio front end for the engine (aiohttp), started with
+# `python app.py serve_async`. The event loop parses requests and answers
+# everything that needs no real search inline: games that are already over,
+# 3x3 positions in the opening book and, without the book, 3x3 positions
+# from its own transposition table, filled at start-up. Larger-board searches
+# run in a bounded pool of worker processes, so cheap requests never queue
+# behind expensive ones:
+#   - admission control: at most `max_pending` searches are queued or running;
+#     further requests get 503 with a Retry-After header;
+#   - deadlines: each request has a deadline (X-Deadline-Ms header, default
+#     TTT_ASYNC_DEADLINE_MS). Larger-board search budgets are cut to fit it,
+#     and a request still waiting at its deadline gets 504;
+#   - cancellation: when the deadline passes or the client disconnects, a
+#     queued search is dropped and a running larger-board search is told to
+#     stop through a flag in shared memory, which frees its worker.
+# Every pool job sends back its worker's search metrics (drained since its
+# last job) and table stats, so /metrics and /engine_stats cover the workers.
+# Serves /predict_move and /predict_moves (JSON and binary), /engine_stats
+# and /metrics. Game sessions and profiling need the Flask server.
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+# `python app.py serve_async` runs app.py as __main__ (and as __mp_main__ in
+# the pool's workers). Register it as `app` so it is not imported twice.
+_main = sys.modules.get('__main__')
+if 'app' not in sys.modules and os.path.realpath(getattr(_main, '__file__', '') or '') == \
+        os.path.join(os.path.dirname(os.path.realpath(__file__)), 'app.py'):
+    sys.modules['app'] = _main
+
+import app as api
+from engine import OPENING_BOOK, warm_up_engine
+from metrics import REGISTRY, Counter, GaugeFunction
+from nk_engine import DEFAULT_BUDGET_MS
+from wire import (
+    BINARY_MIMETYPE, STATUS_ERROR, WINNER_NONE, WireFormatError, decode_batch_request, decode_single_request,
+    encode_batch_response, encode_response, request_to_json, result_codes,
+)
+
+ASYNC_DEADLINE_MS = float(os.environ.get('TTT_ASYNC_DEADLINE_MS', 10000))
+MAX_DEADLINE_MS = 60000
+IPC_MARGIN_MS = 20 # Part of the deadline kept for getting the result back from the worker
+
+ASYNC_OUTCOMES = REGISTRY.register(Counter(
+    'ttt_async_requests_total',
+    "Move requests by how the async server handled them: inline, pool, rejected, timeout or cancelled.", ('outcome',)))
+
+class PoolFull(Exception):
+    """Raised when the search pool already has `max_pending` searches."""
+
+# Metrics recorded by searches, forwarded from the workers to the event loop.
+_FORWARDED_METRICS = (api.PHASE_SECONDS, api.SEARCH_NODES, api.GAME_OVER_ON_ARRIVAL)
+
+# --- Worker side ---
+_cancel_flags = None
+
+class _CancelFlag:
+    """`is_set()` view of one slot of the shared cancel flags, for the search."""
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def is_set(self):
+        return _cancel_flags[self.slot] != 0
+
+def _init_worker(flags):
+    global _cancel_flags
+    _cancel_flags = flags
+    if OPENING_BOOK is None:
+        warm_up_engine()
+
+def _report():
+    """(pid, table stats, metric values drained since the last report), sent
+    back with every job's result."""
+    return os.getpid(), api.cache_stats(), [metric.drain() for metric in _FORWARDED_METRICS]
+
+def _ping(_slot=None):
+    return os.getpid(), _report()
+
+def _predict_job(slot, data):
+    return api.predict_move_result(data, cancel=_CancelFlag(slot)), _report()
+
+def _codes_job(slot, req):
+    return api.predict_move_codes(req, cancel=_CancelFlag(slot)), _report()
+
+def _batch_job(slot, items, deadline):
+    return api._solve_json_items(items, _CancelFlag(slot), deadline), _report()
+
+def _binary_batch_job(slot, requests, deadline):
+    return api._solve_binary_items(requests, _CancelFlag(slot), deadline), _report()
+
+# --- Event loop side ---
+def _sum_table_stats(stats_list):
+    total = {"size": 0, "max_entries": 0, "hits": 0, "misses": 0, "evictions": 0}
+    for stats in stats_list:
+        for field in total:
+            total[field] += stats[field]
+    lookups = total["hits"] + total["misses"]
+    total["hit_rate"] = total["hits"] / lookups if lookups else 0.0
+    return total
+
+class SearchPool:
+    """A process pool that admits at most `max_pending` searches at a time.
+
+    Each admitted search gets a slot in a shared array of cancel flags;
+    setting the flag stops a running larger-board search at its next clock
+    check. A slot is reused only after its search has finished. Jobs return
+    (result, report); the report is merged when the job finishes, even if
+    nobody is waiting for its result any more.
+    """
+
+    def __init__(self, workers, max_pending):
+        context = multiprocessing.get_context('spawn') # No forking of a process with a running event loop
+        self.workers = workers
+        self.max_pending = max_pending
+        self.flags = context.Array('b', max_pending, lock=False)
+        self.executor = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                            initargs=(self.flags,))
+        self._free_slots = list(range(max_pending))
+        self._lock = threading.Lock() # Slots are released from the executor's thread
+        self._worker_tables = {} # pid -> latest cache_stats() of that worker
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self.max_pending - len(self._free_slots)
+
+    def _release(self, slot):
+        with self._lock:
+            self._free_slots.append(slot)
+
+    def _merge_report(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        pid, tables, metric_values = future.result()[1]
+        for metric, values in zip(_FORWARDED_METRICS, metric_values):
+            metric.merge(values)
+        with self._lock:
+            self._worker_tables[pid] = tables
+
+    def cache_stats(self):
+        """Table stats by engine, summed over the event loop and the workers
+        (as last reported by each)."""
+        with self._lock:
+            tables = [api.cache_stats()] + list(self._worker_tables.values())
+        return {engine_name: _sum_table_stats([stats[engine_name] for stats in tables])
+                for engine_name in ("3x3", "nk")}
+
+    async def start(self):
+        """Starts every worker (and its warm-up) before the first request."""
+        loop = asyncio.get_running_loop()
+        futures = [self.executor.submit(_ping) for _ in range(self.workers)]
+        for future in futures:
+            future.add_done_callback(self._merge_report)
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+
+    async def run(self, timeout, job, *args):
+        """Runs `job(slot, *args)` in a worker and waits up to `timeout` seconds.
+
+        Raises PoolFull without queueing if no slot is free, and
+        asyncio.TimeoutError at the deadline. On timeout or cancellation of
+        the awaiting task, the search is dropped or told to stop.
+        """
+        with self._lock:
+            if not self._free_slots:
+                raise PoolFull()
+            slot = self._free_slots.pop()
+        self.flags[slot] = 0
+        future = self.executor.submit(job, slot, *args)
+        future.add_done_callback(lambda _future: self._release(slot))
+        future.add_done_callback(self._merge_report)
+        try:
+            return (await asyncio.wait_for(asyncio.wrap_future(future), timeout))[0]
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self.flags[slot] = 1
+            future.cancel()
+            raise
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def _deadline_ms(request):
+    value = request.headers.get('X-Deadline-Ms')
+    try:
+        deadline_ms = float(value) if value is not None else ASYNC_DEADLINE_MS
+    except ValueError:
+        deadline_ms = ASYNC_DEADLINE_MS
+    return min(max(deadline_ms, 1.0), MAX_DEADLINE_MS)
+
+def _wants_binary(request, request_is_binary):
+    """Same negotiation as the Flask app, from the same parsed Accept header
+    (q-values included)."""
+    return api.negotiate_binary(parse_accept_header(request.headers.get('Accept'), MIMEAccept), request_is_binary)
+
+def make_async_app(pool):
+    """Builds the aiohttp application around a started SearchPool."""
+    from aiohttp import web
+
+    def error_response(respond_binary, message, status, headers=None):
+        if respond_binary:
+            return web.Response(body=encode_response(STATUS_ERROR, None, WINNER_NONE, message), status=status,
+                                content_type=BINARY_MIMETYPE, headers=headers)
+        return web.json_response({"error": message}, status=status, headers=headers)
+
+    async def offload(respond_binary, timeout, job, *args):
+        """Runs a search job in the pool; returns (result, None) or (None, error response)."""
+        try:
+            result = await pool.run(timeout, job, *args)
+        except PoolFull:
+            ASYNC_OUTCOMES.inc('rejected')
+            return None, error_response(respond_binary, "Server busy, too many searches in progress.", 503,
+                                        {"Retry-After": "1"})
+        except asyncio.TimeoutError:
+            ASYNC_OUTCOMES.inc('timeout')
+            return None, error_response(respond_binary, api.DEADLINE_ERROR, 504)
+        except asyncio.CancelledError: # Client disconnected
+            ASYNC_OUTCOMES.inc('cancelled')
+            raise
+        ASYNC_OUTCOMES.inc('pool')
+        return result, None
+
+    async def predict_move(request):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _deadline_ms(request) / 1000
+        request_is_binary = request.content_type == BINARY_MIMETYPE
+        respond_binary = _wants_binary(request, request_is_binary)
+        body = await request.read()
+
+        def search_budget_ms():
+            return (deadline - loop.time()) * 1000 - IPC_MARGIN_MS
+
+        if request_is_binary:
+            try:
+                req = decode_single_request(body)
+            except WireFormatError as e:
+                req = e
+            if isinstance(req, WireFormatError):
+                return error_response(respond_binary, str(req), 400)
+            if respond_binary:
+                codes = api.predict_move_codes(req, allow_search=False)
+                if codes is None:
+                    budget_ms = search_budget_ms()
+                    if budget_ms <= 0:
+                        ASYNC_OUTCOMES.inc('timeout')
+                        return error_response(True, "Deadline too short for a search.", 504)
+                    req = req._replace(budget_ms=min(req.budget_ms or DEFAULT_BUDGET_MS, budget_ms))
+                    codes, error = await offload(True, deadline - loop.time(), _codes_job, req)
+                    if error is not None:
+                        return error
+                else:
+                    ASYNC_OUTCOMES.inc('inline')
+                return web.Response(body=encode_response(*codes), content_type=BINARY_MIMETYPE)
+            data = request_to_json(req)
+        else:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+
+        result, status = api.predict_move_result(data, allow_search=False)
+        if result is None:
+            budget_ms = search_budget_ms()
+            if budget_ms <= 0:
+                ASYNC_OUTCOMES.inc('timeout')
+                return error_response(respond_binary, "Deadline too short for a search.", 504)
+            outcome, error = await offload(respond_binary, deadline - loop.time(), _predict_job,
+                                           api._cap_budget(data, budget_ms))
+            if error is not None:
+                return error
+            result, status = outcome
+        else:
+            ASYNC_OUTCOMES.inc('inline')
+        if respond_binary:
+            message = result.get("error", "") if status != 200 else ''
+            codes = result_codes(result, data.get('ai_symbol') if isinstance(data, dict) else None)
+            return web.Response(body=encode_response(*codes, message), status=status, content_type=BINARY_MIMETYPE)
+        return web.json_response(result, status=status)
+
+    async def predict_moves(request):
+        """Batches run inline if no item needs a search, otherwise as one pool
+        job that cuts each item's budget to the time left before the deadline."""
+        # Absolute deadline for the worker: time.monotonic() is shared by all processes.
+        deadline = time.monotonic() + _deadline_ms(request) / 1000
+        request_is_binary = request.content_type == BINARY_MIMETYPE
+        respond_binary = _wants_binary(request, request_is_binary)
+        body = await request.read()
+        if request_is_binary:
+            try:
+                requests = decode_batch_request(body)
+            except WireFormatError as e:
+                return web.json_response({"error": str(e)}, status=400)
+            if len(requests) > api.MAX_BATCH_SIZE:
+                return web.json_response({"error": f"Too many items in batch. Maximum is {api.MAX_BATCH_SIZE}."},
+                                         status=400)
+            if respond_binary:
+                codes = [(STATUS_ERROR, None, WINNER_NONE) if isinstance(req, WireFormatError)
+                         else api.predict_move_codes(req, 'predict_moves', allow_search=False) for req in requests]
+                if any(code is None for code in codes):
+                    codes, error = await offload(True, deadline - time.monotonic(), _binary_batch_job, requests,
+                                                 deadline - IPC_MARGIN_MS / 1000)
+                    if error is not None:
+                        return error
+                else:
+                    ASYNC_OUTCOMES.inc('inline')
+                return web.Response(body=encode_batch_response(codes), content_type=BINARY_MIMETYPE)
+            items = [req if isinstance(req, WireFormatError) else request_to_json(req) for req in requests]
+        else:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            items = data.get('items') if isinstance(data, dict) else None
+            if not isinstance(items, list):
+                return web.json_response({"error": "Invalid input. Expected {\"items\": [...]}."}, status=400)
+            if len(items) > api.MAX_BATCH_SIZE:
+                return web.json_response({"error": f"Too many items in batch. Maximum is {api.MAX_BATCH_SIZE}."},
+                                         status=400)
+
+        results = [{"error": str(item)} if isinstance(item, WireFormatError)
+                   else api.predict_move_result(item, 'predict_moves', allow_search=False)[0] for item in items]
+        if any(result is None for result in results):
+            results, error = await offload(respond_binary, deadline - time.monotonic(), _batch_job, items,
+                                           deadline - IPC_MARGIN_MS / 1000)
+            if error is not None:
+                return error
+        else:
+            ASYNC_OUTCOMES.inc('inline')
+        if respond_binary:
+            codes = [result_codes(result, item.get('ai_symbol') if isinstance(item, dict) else None)
+                     for item, result in zip(items, results)]
+            return web.Response(body=encode_batch_response(codes), content_type=BINARY_MIMETYPE)
+        return web.json_response({"results": results, "status": "success"})
+
+    async def engine_stats(_request):
+        tables = pool.cache_stats()
+        return web.json_response({"transposition_table": tables["3x3"], "nk_transposition_table": tables["nk"],
+                                  "search_pool": {"workers": pool.workers, "pending": pool.pending,
+                                                  "max_pending": pool.max_pending}})
+
+    async def metrics(_request):
+        return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': api.CONTENT_TYPE})
+
+    api.cache_stats_source = pool.cache_stats
+    REGISTRY.register(GaugeFunction('ttt_async_pool_pending', "Searches queued or running in the async server's pool.",
+                                    (), lambda: [((), pool.pending)]))
+    application = web.Application()
+    application.router.add_post('/predict_move', predict_move)
+    application.router.add_post('/predict_moves', predict_moves)
+    application.router.add_get('/engine_stats', engine_stats)
+    application.router.add_get('/metrics', metrics)
+    return application
+
+def run_async_server(bind, workers, max_pending=None):
+    """Serves the API from one asyncio process plus `workers` search processes."""
+    try:
+        from aiohttp import web
+    except ImportError:
+        print("The 'serve_async' mode requires aiohttp: pip install aiohttp")
+        raise SystemExit(1)
+    host, _, port = bind.rpartition(':')
+    pool = SearchPool(workers, max_pending or workers * 4)
+
+    async def start_pool(_application):
+        if OPENING_BOOK is None:
+            warm_up_engine() # 3x3 moves are then answered inline from the table
+        await pool.start()
+        print(f"Search pool ready: {pool.workers} worker(s), up to {pool.max_pending} pending searches.")
+
+    async def stop_pool(_application):
+        pool.shutdown()
+
+    application = make_async_app(pool)
+    application.on_startup.append(start_pool)
+    application.on_cleanup.append(stop_pool)
+    # handler_cancellation: a client disconnect cancels its handler, which cancels its search.
+    web.run_app(application, host=host or '127.0.0.1', port=int(port), handler_cancellation=True)
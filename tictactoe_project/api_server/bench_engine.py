@@ -0,0 +1,272 @@
+# api_server/bench_engine.py
+# Engine benchmark suite. Measures search speed, per-move latency for every
+# reachable position (grouped by ply), transposition table hit rates,
+# /predict_move and /predict_moves throughput through the Flask test client
+# (JSON and binary formats), fixed-depth node counts of the larger-board
+# engine and simulation throughput, and writes everything as JSON so runs can
+# be compared across commits.
+#
+#   python bench_engine.py [--output bench_results.json] [--compare old.json]
+#
+# With --compare, the run exits with status 1 if a tracked metric got worse
+# than the baseline by more than --tolerance (default 25%).
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import engine
+from engine import EMPTY, find_best_move, book_move, reachable_positions, transposition_table
+
+# Metrics checked by --compare: (path in the results, True if higher is better).
+TRACKED_METRICS = (
+    (("search", "nodes_per_second"), True),
+    (("search", "nodes_per_move"), False),
+    (("nk_search", "total_nodes"), False),
+    (("move_latency_ms", "cold", "all", "p50"), False),
+    (("move_latency_ms", "warm", "all", "p50"), False),
+    (("api", "predict_move_ms", "p50"), False),
+    (("api", "predict_move_ms", "p99"), False),
+    (("api", "binary_requests_per_second"), True),
+    (("api", "binary_batch_items_per_second"), True),
+    (("simulation", "search_games_per_second"), True),
+    (("simulation", "vectorized_games_per_second"), True),
+)
+
+def percentiles(samples_ms):
+    """Summarizes latencies in milliseconds."""
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {}
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+    return {"count": len(ordered), "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99),
+            "max": round(ordered[-1], 4), "mean": round(sum(ordered) / len(ordered), 4)}
+
+def bench_search(positions):
+    """Cold search of every position (empty table before each), for raw node throughput."""
+    nodes_before = engine.nodes_searched
+    start = time.perf_counter()
+    for board in positions:
+        transposition_table.clear()
+        find_best_move(board, 'X', 'O', use_book=False)
+    elapsed = time.perf_counter() - start
+    nodes = engine.nodes_searched - nodes_before
+    return {"positions": len(positions), "nodes": nodes, "seconds": round(elapsed, 4),
+            "nodes_per_second": round(nodes / elapsed), "nodes_per_move": round(nodes / len(positions), 2)}
+
+# Larger-board positions searched to a fixed depth: (name, size, k, stones, depth).
+NK_CASES = (
+    ("4x4_k4_empty", 4, 4, (), 6),
+    ("5x5_k4_2_stones", 5, 4, ((2, 2), (1, 1)), 5),
+    ("7x7_k5_4_stones", 7, 5, ((3, 3), (2, 2), (3, 4), (4, 4)), 4),
+    ("15x15_k5_6_stones", 15, 5, ((7, 7), (6, 6), (7, 8), (8, 8), (6, 7), (7, 6)), 4),
+)
+
+def bench_nk_search():
+    """Nodes and time per decision for the N x N engine at a fixed depth, from
+    an empty table, so move-ordering changes show up as node counts."""
+    from nk_engine import find_best_move_nk, nk_transposition_table
+    report = {}
+    for name, size, win_length, stones, depth in NK_CASES:
+        board = [EMPTY] * (size * size)
+        for i, (row, col) in enumerate(stones):
+            board[row * size + col] = 'XO'[i % 2]
+        nk_transposition_table.clear()
+        result = find_best_move_nk(board, 'X', 'O', size, win_length, budget_ms=600000,
+                                   rng=random.Random(0), max_depth=depth)
+        report[name] = {"depth": result.depth, "nodes": result.nodes, "ms": round(result.elapsed_ms, 2)}
+    report["total_nodes"] = sum(case["nodes"] for case in report.values())
+    return report
+
+def bench_move_latency(positions):
+    """Per-move latency for every position, grouped by ply (stones on the board).
+
+    'cold' clears the transposition table before each move, 'warm' keeps it
+    (after one warm-up pass), 'book' is the opening book lookup.
+    """
+    by_ply = {"cold": {}, "warm": {}, "book": {}}
+
+    def timed(mode, board, fn):
+        start = time.perf_counter()
+        fn()
+        ply = 9 - board.count(EMPTY)
+        by_ply[mode].setdefault(ply, []).append((time.perf_counter() - start) * 1000)
+
+    for board in positions:
+        transposition_table.clear()
+        timed("cold", board, lambda: find_best_move(board, 'X', 'O', use_book=False))
+
+    transposition_table.clear()
+    engine.warm_up_engine()
+    stats_before = transposition_table.stats()
+    for board in positions:
+        timed("warm", board, lambda: find_best_move(board, 'X', 'O', use_book=False))
+    stats_after = transposition_table.stats()
+
+    if engine.OPENING_BOOK is not None:
+        for board in positions:
+            timed("book", board, lambda: book_move(board, 'X', 'O'))
+
+    report = {}
+    for mode, plies in by_ply.items():
+        if not plies:
+            continue
+        report[mode] = {"all": percentiles([ms for samples in plies.values() for ms in samples])}
+        report[mode]["by_ply"] = {str(ply): percentiles(samples) for ply, samples in sorted(plies.items())}
+
+    hits = stats_after["hits"] - stats_before["hits"]
+    misses = stats_after["misses"] - stats_before["misses"]
+    cache = {"warm_sweep_hits": hits, "warm_sweep_misses": misses,
+             "warm_sweep_hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+             "table_size": stats_after["size"]}
+    return report, cache
+
+def bench_api(positions, requests_count, batch_size=100):
+    """End-to-end /predict_move and /predict_moves latency through the Flask
+    test client, in JSON and in the binary wire format, on the same boards."""
+    from app import app
+    from wire import BINARY_MIMETYPE, encode_batch_request, encode_request
+    client = app.test_client()
+    rng = random.Random(0)
+    boards = [rng.choice(positions) for _ in range(requests_count)]
+
+    def timed_posts(path, bodies, **kwargs):
+        samples = []
+        for body in bodies:
+            start = time.perf_counter()
+            response = client.post(path, **{kwargs['field']: body}, content_type=kwargs['content_type'])
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}: {response.data[:200]!r}")
+        return samples
+
+    json_samples = timed_posts('/predict_move', [{"board": board, "ai_symbol": 'X', "opponent_symbol": 'O'}
+                                                  for board in boards], field='json', content_type='application/json')
+    binary_samples = timed_posts('/predict_move', [encode_request(board, 'X', 'O') for board in boards],
+                                 field='data', content_type=BINARY_MIMETYPE)
+    batches = [[{"board": board, "ai_symbol": 'X', "opponent_symbol": 'O'} for board in boards[i:i + batch_size]]
+               for i in range(0, len(boards), batch_size)]
+    json_batch_samples = timed_posts('/predict_moves', [{"items": batch} for batch in batches],
+                                     field='json', content_type='application/json')
+    binary_batch_samples = timed_posts('/predict_moves', [encode_batch_request(batch) for batch in batches],
+                                       field='data', content_type=BINARY_MIMETYPE)
+
+    def per_second(samples, per_request=1):
+        return round(len(samples) * per_request / (sum(samples) / 1000))
+
+    json_rate, binary_rate = per_second(json_samples), per_second(binary_samples)
+    json_batch_rate = per_second(json_batch_samples, batch_size)
+    binary_batch_rate = per_second(binary_batch_samples, batch_size)
+    return {"predict_move_ms": percentiles(json_samples), "requests_per_second": json_rate,
+            "binary_predict_move_ms": percentiles(binary_samples), "binary_requests_per_second": binary_rate,
+            "binary_speedup": round(binary_rate / json_rate, 2),
+            "batch_size": batch_size, "batch_items_per_second": json_batch_rate,
+            "binary_batch_items_per_second": binary_batch_rate,
+            "binary_batch_speedup": round(binary_batch_rate / json_batch_rate, 2)}
+
+def bench_simulation(search_games, vectorized_games):
+    """Games per second for the search-based and the vectorized simulators."""
+    from simulation import simulate_games_main, simulate_games_vectorized
+    import numpy as np
+
+    start = time.perf_counter()
+    simulate_games_main(search_games, True, rng=random.Random(0), verbose=False)
+    search_rate = search_games / (time.perf_counter() - start)
+
+    simulate_games_vectorized(1000, True, np.random.default_rng(0)) # Build the solved table first
+    start = time.perf_counter()
+    simulate_games_vectorized(vectorized_games, True, np.random.default_rng(0))
+    vectorized_rate = vectorized_games / (time.perf_counter() - start)
+    return {"search_games": search_games, "search_games_per_second": round(search_rate),
+            "vectorized_games": vectorized_games, "vectorized_games_per_second": round(vectorized_rate)}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance, tracked=TRACKED_METRICS):
+    """Returns a list of regressions of the `tracked` metrics against `baseline`."""
+    regressions = []
+    for path, higher_is_better in tracked:
+        current, previous = results, baseline
+        for key in path:
+            current = current.get(key, {}) if isinstance(current, dict) else None
+            previous = previous.get(key, {}) if isinstance(previous, dict) else None
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or previous == 0:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressions.append(f"{'.'.join(path)}: {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Tic-Tac-Toe engine, API and simulations.")
+    parser.add_argument('--output', default='bench_results.json', help="Where to write the JSON results.")
+    parser.add_argument('--requests', type=int, default=2000, help="Number of /predict_move requests to time.")
+    parser.add_argument('--search-games', type=int, default=500, help="Games for the search-based simulation.")
+    parser.add_argument('--vectorized-games', type=int, default=200000, help="Games for the vectorized simulation.")
+    parser.add_argument('--skip-simulation', action='store_true', help="Skip the simulation benchmark (needs NumPy).")
+    parser.add_argument('--compare', help="Baseline results JSON to check for regressions.")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed relative slowdown before --compare fails (default: 0.25).")
+    args = parser.parse_args()
+
+    positions = reachable_positions('X', 'O')
+    results = {
+        "meta": {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                 "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'), "opening_book": engine.OPENING_BOOK is not None},
+    }
+    print(f"Benchmarking search over {len(positions)} reachable positions...")
+    results["search"] = bench_search(positions)
+    print("Benchmarking per-move latency...")
+    results["move_latency_ms"], results["cache"] = bench_move_latency(positions)
+    print("Benchmarking the larger-board engine at fixed depths...")
+    results["nk_search"] = bench_nk_search()
+    print(f"Benchmarking {args.requests} /predict_move requests...")
+    results["api"] = bench_api(positions, args.requests)
+    if not args.skip_simulation:
+        print("Benchmarking simulations...")
+        results["simulation"] = bench_simulation(args.search_games, args.vectorized_games)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\nSearch: {results['search']['nodes_per_second']:,} nodes/s, "
+          f"{results['search']['nodes_per_move']} nodes per cold move")
+    for mode, report in results["move_latency_ms"].items():
+        print(f"Move latency ({mode}): p50 {report['all']['p50']} ms, p99 {report['all']['p99']} ms")
+    print(f"Larger boards: {results['nk_search']['total_nodes']:,} nodes over {len(NK_CASES)} fixed-depth searches")
+    print(f"Warm cache hit rate: {results['cache']['warm_sweep_hit_rate']}")
+    api = results["api"]["predict_move_ms"]
+    print(f"/predict_move: p50 {api['p50']} ms, p90 {api['p90']} ms, p99 {api['p99']} ms")
+    api = results["api"]
+    print(f"Binary format: {api['binary_requests_per_second']:,} vs {api['requests_per_second']:,} requests/s "
+          f"({api['binary_speedup']}x), batches of {api['batch_size']}: {api['binary_batch_items_per_second']:,} "
+          f"vs {api['batch_items_per_second']:,} items/s ({api['binary_batch_speedup']}x)")
+    if "simulation" in results:
+        sim = results["simulation"]
+        print(f"Simulation: {sim['search_games_per_second']:,} games/s (search), "
+              f"{sim['vectorized_games_per_second']:,} games/s (vectorized)")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
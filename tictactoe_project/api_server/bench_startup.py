@@ -0,0 +1,66 @@
+# api_server/bench_startup.py
+# Startup benchmark for the 'api' mode: measures how long `import app` takes
+# and how much memory the process holds afterwards, in a fresh interpreter.
+# Exits with status 1 if either exceeds its limit or if a plotting/numeric
+# dependency gets imported, so it can gate changes in CI.
+#
+#   python bench_startup.py [--runs 5] [--max-import-ms 400] [--max-rss-mb 50]
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ('numpy', 'matplotlib')
+
+# Runs in the child interpreter. ru_maxrss is in KiB on Linux and bytes on macOS.
+PROBE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+print(json.dumps({"import_ms": import_ms, "rss_mb": rss_mb,
+                  "heavy_modules": [m for m in %r if m in sys.modules]}))
+''' % (HEAVY_MODULES,)
+
+def measure_once():
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=here, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API startup import time and memory.")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to start (median is reported).")
+    parser.add_argument('--max-import-ms', type=float, default=400.0, help="Fail if the median import time exceeds this.")
+    parser.add_argument('--max-rss-mb', type=float, default=50.0, help="Fail if the median RSS exceeds this.")
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    import_ms = sorted(s['import_ms'] for s in samples)[len(samples) // 2]
+    rss_mb = sorted(s['rss_mb'] for s in samples)[len(samples) // 2]
+    heavy = sorted({m for s in samples for m in s['heavy_modules']})
+    result = {"import_ms": round(import_ms, 1), "rss_mb": round(rss_mb, 1), "heavy_modules": heavy,
+              "limits": {"max_import_ms": args.max_import_ms, "max_rss_mb": args.max_rss_mb}}
+
+    print(f"'api' mode startup: import {import_ms:.1f} ms, RSS {rss_mb:.1f} MB (median of {args.runs} runs)")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if import_ms > args.max_import_ms:
+        failures.append(f"import time {import_ms:.1f} ms exceeds {args.max_import_ms} ms")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB exceeds {args.max_rss_mb} MB")
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
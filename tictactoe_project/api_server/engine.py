@@ -0,0 +1,652 @@
+# api_server/engine.py
+# Game rules and the minimax search engine. Kept free of web and plotting
+# dependencies so the API, simulations and tools can import it cheaply.
+import random
+import math
+import os
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+
+# --- 1. Game Environment Setup (Unchanged from previous version) ---
+EMPTY = ' '
+# AI_PLAYER = 'O' # These will be dynamic in the API
+# HUMAN_PLAYER = 'X'
+
+def print_board(board):
+    """Prints the Tic-Tac-Toe board."""
+    print("\n")
+    print(f" {board[0]} | {board[1]} | {board[2]} ")
+    print("---|---|---")
+    print(f" {board[3]} | {board[4]} | {board[5]} ")
+    print("---|---|---")
+    print(f" {board[6]} | {board[7]} | {board[8]} ")
+    print("\n")
+
+WIN_LINES = (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),
+    (0, 4, 8), (2, 4, 6)
+)
+
+def check_winner(board, player):
+    """Checks if the given player has won."""
+    for a, b, c in WIN_LINES:
+        if board[a] == player and board[b] == player and board[c] == player:
+            return True
+    return False
+
+def is_board_full(board):
+    """Checks if the board is full (tie)."""
+    return EMPTY not in board
+
+def get_available_moves(board):
+    """Returns a list of indices of available (empty) moves."""
+    return [i for i, spot in enumerate(board) if spot == EMPTY]
+
+def make_move(board, move, player):
+    """Makes a move on the board. Returns a new board state."""
+    if 0 <= move < len(board) and board[move] == EMPTY:
+        new_board = board[:]
+        new_board[move] = player
+        return new_board
+    return None
+
+# --- 1b. Bitboard Engine (used by the search hot path) ---
+# Each player's stones are a 9-bit integer (bit i = cell i). Wins are checked
+# with a single table lookup and moves are made and undone by OR-ing bits,
+# so the search never copies a board.
+FULL_BOARD = (1 << 9) - 1
+WIN_MASKS = tuple(sum(1 << i for i in line) for line in WIN_LINES)
+# IS_WINNING[bits] is True if the stones in `bits` complete any win line.
+IS_WINNING = tuple(any(bits & mask == mask for mask in WIN_MASKS) for bits in range(1 << 9))
+# MOVES_FOR[empty_bits] lists the empty cells in index order (same as get_available_moves).
+MOVES_FOR = tuple(tuple(i for i in range(9) if empty & (1 << i)) for empty in range(1 << 9))
+MOVE_BITS = tuple(1 << i for i in range(9))
+# WINNING_CELLS[bits] has a bit set for every cell that would complete a line
+# for the stones in `bits` (whether or not the cell is free).
+WINNING_CELLS = tuple(
+    sum(mask & ~bits for mask in WIN_MASKS if bin(mask & bits).count('1') == 2) & FULL_BOARD
+    for bits in range(1 << 9)
+)
+# Static move order: centre, then corners, then edges.
+CENTRE_FIRST = (4, 0, 2, 6, 8, 1, 3, 5, 7)
+ORDERED_MOVES_FOR = tuple(tuple(i for i in CENTRE_FIRST if empty & (1 << i)) for empty in range(1 << 9))
+
+def _bits_to_board(ai_bits, opp_bits, ai_symbol='O', opp_symbol='X'):
+    """Builds a list board from two bitboards (mostly for tools and checks)."""
+    return [ai_symbol if ai_bits >> i & 1 else opp_symbol if opp_bits >> i & 1 else EMPTY for i in range(9)]
+
+def board_to_bits(board, player):
+    """Returns the bitboard of `player`'s stones on a list board."""
+    bits = 0
+    for i, spot in enumerate(board):
+        if spot == player:
+            bits |= 1 << i
+    return bits
+
+# --- 1c. Board Symmetries ---
+# The board has 8 symmetries (4 rotations, each optionally mirrored). Caches
+# and the opening book store only one canonical representative per class
+# and map moves back through the inverse transform.
+def _transform_cell(cell, transform):
+    """Where `cell` ends up after rotating `transform % 4` quarter turns, then mirroring if transform >= 4."""
+    row, col = divmod(cell, 3)
+    for _ in range(transform % 4):
+        row, col = col, 2 - row
+    if transform >= 4:
+        col = 2 - col
+    return row * 3 + col
+
+SYMMETRIES = tuple(tuple(_transform_cell(i, t) for i in range(9)) for t in range(8))
+# INVERSE_SYMMETRIES[t][cell] is the original cell that transform t moved to `cell`.
+INVERSE_SYMMETRIES = tuple(tuple(perm.index(i) for i in range(9)) for perm in SYMMETRIES)
+# TRANSFORMED_BITS[t][bits] applies transform t to a bitboard.
+TRANSFORMED_BITS = tuple(
+    tuple(sum(1 << perm[i] for i in range(9) if bits & (1 << i)) for bits in range(1 << 9))
+    for perm in SYMMETRIES
+)
+
+def canonical_position(ai_bits, opp_bits):
+    """Returns (canonical_key, transform) for a position.
+
+    canonical_key packs the transformed bitboards as `ai | opp << 9` and is the
+    smallest over all 8 symmetries; `transform` is the one that produced it.
+    """
+    best_key = ai_bits | (opp_bits << 9)
+    best_transform = 0
+    for transform in range(1, 8):
+        table = TRANSFORMED_BITS[transform]
+        key = table[ai_bits] | (table[opp_bits] << 9)
+        if key < best_key:
+            best_key = key
+            best_transform = transform
+    return best_key, best_transform
+
+# --- 2. Minimax Algorithm Implementation ---
+# Transposition table entry flags: whether the stored value is exact or only
+# a bound produced by an alpha-beta cutoff.
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+class TranspositionTable:
+    """Search results shared across requests, capped in size with LRU eviction.
+
+    Entries map a key to (depth, value, flag, best_move): `depth` is the
+    number of plies left to search below the position, `value` is scored as if
+    the position were the search root (see `_score_to_tt`), `flag` says
+    whether the value is EXACT or only a LOWER_BOUND / UPPER_BOUND, and
+    `best_move` (or None) is tried first when the position is searched again.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock() # Flask serves requests from several threads
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.warm = False # Set by warm_up_engine: every position the AI can face is stored
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def store(self, key, depth, value, flag, best_move=None):
+        with self._lock:
+            self._entries[key] = (depth, value, flag, best_move)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+            self.warm = False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+TRANSPOSITION_TABLE_SIZE = int(os.environ.get('TTT_TT_SIZE', 200000))
+transposition_table = TranspositionTable(TRANSPOSITION_TABLE_SIZE)
+# Total nodes visited by the search since start-up (read by the benchmarks).
+# Each decision counts into its SearchState and adds the total when done.
+nodes_searched = 0
+
+def _score_to_tt(score, depth):
+    """Removes the distance from the root so a score can be reused at any depth."""
+    if score > 0:
+        return score + depth
+    if score < 0:
+        return score - depth
+    return score
+
+def _score_from_tt(value, depth):
+    """Inverse of `_score_to_tt` for a position found at `depth`."""
+    if value > 0:
+        return value - depth
+    if value < 0:
+        return value + depth
+    return value
+
+class SearchState:
+    """Move-ordering heuristics gathered during one decision.
+
+    `killers[depth]` holds the last two moves that caused a beta cutoff at
+    that depth, and `history[cell]` grows each time a move to `cell` does.
+    `nodes` counts the positions this decision visited.
+    """
+
+    def __init__(self):
+        self.killers = {}
+        self.history = [0] * 9
+        self.nodes = 0
+
+    def record_cutoff(self, move_idx, depth, remaining):
+        killers = self.killers.setdefault(depth, [])
+        if move_idx not in killers:
+            killers.insert(0, move_idx)
+            del killers[2:]
+        self.history[move_idx] += remaining * remaining
+
+def _ordered_moves(me, opp, empty, depth, tt_move, state):
+    """Moves for the side to move (`me`), most promising first.
+
+    An immediate win is returned on its own since no other move can score
+    better. Otherwise: the transposition table move, moves that block an
+    opponent win, killer moves, then the rest by history score, with ties in
+    centre/corner/edge order.
+    """
+    wins = WINNING_CELLS[me] & empty
+    if wins:
+        return (MOVES_FOR[wins][0],)
+    moves = ORDERED_MOVES_FOR[empty]
+    if len(moves) == 1:
+        return moves
+    blocks = WINNING_CELLS[opp] & empty
+    killers = state.killers.get(depth, ())
+    history = state.history
+
+    def priority(move_idx):
+        if move_idx == tt_move:
+            return (3, 0)
+        if blocks & MOVE_BITS[move_idx]:
+            return (2, 0)
+        if move_idx in killers:
+            return (1, 0)
+        return (0, history[move_idx])
+
+    return sorted(moves, key=priority, reverse=True) # Stable, so equal moves keep the static order
+
+def minimax(board, depth, is_maximizing_player, alpha, beta, ai_player_symbol, human_player_symbol):
+    """Scores a position from the AI's point of view (10 - depth for an AI
+    win, depth - 10 for a loss, 0 for a tie) with the negamax search."""
+    global nodes_searched
+    ai_bits = board_to_bits(board, ai_player_symbol)
+    human_bits = board_to_bits(board, human_player_symbol)
+    state = SearchState()
+    if is_maximizing_player:
+        score = _negamax_bits(ai_bits, human_bits, depth, alpha, beta, state)
+    else:
+        score = -_negamax_bits(human_bits, ai_bits, depth, -beta, -alpha, state)
+    nodes_searched += state.nodes
+    return score
+
+def _negamax_bits(me, opp, depth, alpha, beta, state):
+    """Bitboard negamax: the score of a position for the side to move (`me`).
+
+    Scores use the same scale as `minimax`, seen from the side to move. The
+    transposition table key is the canonical form of (me, opp), so it covers
+    both symbols, both sides to move and all 8 symmetric variants.
+    """
+    state.nodes += 1
+    if IS_WINNING[me]:
+        return 10 - depth
+    if IS_WINNING[opp]:
+        return depth - 10
+    empty = FULL_BOARD & ~(me | opp)
+    if not empty:
+        return 0
+    remaining = len(MOVES_FOR[empty])
+
+    key, transform = canonical_position(me, opp)
+    tt_move = None
+    entry = transposition_table.get(key)
+    if entry is not None:
+        if entry[0] >= remaining:
+            value = _score_from_tt(entry[1], depth)
+            flag = entry[2]
+            if flag == EXACT:
+                return value
+            if flag == LOWER_BOUND:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if beta <= alpha:
+                return value
+        if entry[3] is not None:
+            tt_move = INVERSE_SYMMETRIES[transform][entry[3]]
+
+    alpha_orig = alpha
+    best_score = -math.inf
+    best_move = None
+    for move_idx in _ordered_moves(me, opp, empty, depth, tt_move, state):
+        score = -_negamax_bits(opp, me | MOVE_BITS[move_idx], depth + 1, -beta, -alpha, state)
+        if score > best_score:
+            best_score = score
+            best_move = move_idx
+        if score > alpha:
+            alpha = score
+        if alpha >= beta:
+            state.record_cutoff(move_idx, depth, remaining)
+            break
+
+    # A value outside the original window is only a bound on the true score.
+    if best_score <= alpha_orig:
+        flag = UPPER_BOUND
+    elif best_score >= beta:
+        flag = LOWER_BOUND
+    else:
+        flag = EXACT
+    transposition_table.store(key, remaining, _score_to_tt(best_score, depth), flag,
+                              SYMMETRIES[transform][best_move])
+    return best_score
+
+def _best_moves_bits(ai_bits, opp_bits, state):
+    """Returns (best_score, best_moves) for the AI to move, over all moves.
+
+    Moves are searched in order with alpha carried over: after the first,
+    each is searched with the window (best - 1, inf). Scores are integers,
+    so a move that ties the best comes back exact while worse ones fail low
+    cheaply, which finds every equally good move without full-window searches.
+    """
+    empty = FULL_BOARD & ~(ai_bits | opp_bits)
+    moves = list(ORDERED_MOVES_FOR[empty])
+    key, transform = canonical_position(ai_bits, opp_bits)
+    entry = transposition_table.get(key)
+    tt_move = INVERSE_SYMMETRIES[transform][entry[3]] if entry is not None and entry[3] is not None else None
+    wins = WINNING_CELLS[ai_bits] & empty
+    blocks = WINNING_CELLS[opp_bits] & empty
+    # Stable sort: moves of the same kind keep the centre-first order.
+    moves.sort(key=lambda m: (m == tt_move, bool(wins & MOVE_BITS[m]), bool(blocks & MOVE_BITS[m])), reverse=True)
+
+    best_score = -math.inf
+    best_moves = []
+    for move_idx in moves:
+        # Depth starts at 0 for the next state, where the opponent is to move
+        alpha = best_score - 1 if best_moves else -math.inf
+        score = -_negamax_bits(opp_bits, ai_bits | MOVE_BITS[move_idx], 0, -math.inf, -alpha, state)
+        if score > best_score:
+            best_score = score
+            best_moves = [move_idx]
+        elif score == best_score:
+            best_moves.append(move_idx)
+    return best_score, best_moves
+
+# --- 3. AI Player Function ---
+def find_best_move(board, ai_player_symbol, human_player_symbol, rng=random, use_book=True, search_state=None):
+    """Returns the AI's best move. `rng` breaks ties between equally good moves
+    (any object with `choice`, e.g. a seeded `random.Random`).
+
+    The move is read from the memory-mapped opening book when it is loaded and
+    has the position; pass use_book=False to always search. Pass a fresh
+    SearchState as `search_state` to read back the nodes the decision took
+    (0 when answered from the book).
+    """
+    return find_best_move_bits(board_to_bits(board, ai_player_symbol), board_to_bits(board, human_player_symbol),
+                               rng, use_book, search_state)
+
+def find_best_move_bits(ai_bits, opp_bits, rng=random, use_book=True, search_state=None):
+    """Bitboard counterpart of `find_best_move` for callers that already keep
+    the position as bits (e.g. game sessions)."""
+    global nodes_searched
+    if use_book and OPENING_BOOK is not None:
+        move = _book_move_bits(ai_bits, opp_bits, rng)
+        if move is not None:
+            return move
+    if not FULL_BOARD & ~(ai_bits | opp_bits):
+        return -1
+
+    # The transposition table is kept across calls: entries carry their bound
+    # type and are scored independently of the root, so they stay valid.
+    # The search order of `best_moves` depends on the table, so draw from a
+    # canonical order: a seeded `rng` then picks the same move whatever the
+    # cache state, and the same move as the opening book would.
+    state = SearchState() if search_state is None else search_state
+    _best_score, best_moves = _best_moves_bits(ai_bits, opp_bits, state)
+    nodes_searched += state.nodes
+    return rng.choice(sorted(best_moves))
+
+# --- 3b. Opening Book (precomputed perfect play) ---
+# The whole game has only a few thousand legal positions, so we solve it once
+# (`python app.py build_book`) and answer moves by lookup.
+# The book is a binary file holding one fixed-size record for every base-3
+# board code: cell i adds 3**i for an AI stone and 2 * 3**i for an opponent
+# stone, the AI being the side to move. Records hold the bitmask of all best
+# moves and their score. The file is memory-mapped read-only, so API worker
+# processes share one copy through the page cache and need no warm-up.
+OPENING_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin')
+OPENING_BOOK_MAGIC = b'TTTB'
+OPENING_BOOK_VERSION = 3
+BOOK_HEADER = struct.Struct('<4sHHI') # magic, version, record size, record count
+BOOK_HEADER_SIZE = 16
+BOOK_RECORD = struct.Struct('<HbB')   # best-move bitmask, score, flags
+BOOK_RECORD_COUNT = 3 ** 9
+BOOK_VALID = 1                        # flags: the record holds a solved position
+
+# BASE3_OF_BITS[bits] is the sum of 3**i over the set bits.
+BASE3_OF_BITS = tuple(sum(3 ** i for i in range(9) if bits & (1 << i)) for bits in range(1 << 9))
+
+def encode_position(ai_bits, opp_bits):
+    """Returns the base-3 board code used to index the opening book."""
+    return BASE3_OF_BITS[ai_bits] + 2 * BASE3_OF_BITS[opp_bits]
+
+def decode_position(code):
+    """Inverse of `encode_position`: returns (ai_bits, opp_bits)."""
+    ai_bits = opp_bits = 0
+    for i in range(9):
+        code, cell = divmod(code, 3)
+        if cell == 1:
+            ai_bits |= 1 << i
+        elif cell == 2:
+            opp_bits |= 1 << i
+    return ai_bits, opp_bits
+
+def _exact_value(board, ai_to_move, ai_player_symbol, human_player_symbol, cache):
+    """Full-window minimax value of a position, scored as if it were at depth 0.
+
+    Used only to build the book. Unlike `minimax`, it never prunes, so every
+    cached value is exact and can be shared between parents at any depth.
+    """
+    key = (tuple(board), ai_to_move)
+    if key in cache:
+        return cache[key]
+    if check_winner(board, ai_player_symbol):
+        value = 10
+    elif check_winner(board, human_player_symbol):
+        value = -10
+    elif is_board_full(board):
+        value = 0
+    else:
+        mover = ai_player_symbol if ai_to_move else human_player_symbol
+        child_values = []
+        for move_idx in get_available_moves(board):
+            child = _exact_value(make_move(board, move_idx, mover), not ai_to_move,
+                                 ai_player_symbol, human_player_symbol, cache)
+            # A win/loss one ply further away is worth one point less, as in `minimax`.
+            if child > 0:
+                child -= 1
+            elif child < 0:
+                child += 1
+            child_values.append(child)
+        value = max(child_values) if ai_to_move else min(child_values)
+    cache[key] = value
+    return value
+
+def solve_opening_book():
+    """Solves every reachable position with the AI to move.
+
+    Returns a dict that maps a canonical position key to [score, best_moves], with moves
+    given in the canonical orientation and score on the same scale as
+    `find_best_move` (10 - depth for a win, depth - 10 for a loss).
+    """
+    ai, opp = 'O', 'X' # Any two symbols will do, positions are stored relative
+    cache = {}
+    positions = {}
+
+    def visit(board, ai_to_move):
+        if check_winner(board, ai) or check_winner(board, opp) or is_board_full(board):
+            return
+        mover = ai if ai_to_move else opp
+        if ai_to_move:
+            code, transform = canonical_position(board_to_bits(board, ai), board_to_bits(board, opp))
+            if code in positions:
+                return
+            scores = {move_idx: _exact_value(make_move(board, move_idx, ai), False, ai, opp, cache)
+                      for move_idx in get_available_moves(board)}
+            best_score = max(scores.values())
+            best_moves = sorted(SYMMETRIES[transform][m] for m, s in scores.items() if s == best_score)
+            positions[code] = [best_score, best_moves]
+        for move_idx in get_available_moves(board):
+            visit(make_move(board, move_idx, mover), not ai_to_move)
+
+    visit([EMPTY] * 9, True)  # AI plays first
+    visit([EMPTY] * 9, False) # AI plays second
+    return positions
+
+def opening_book_bytes():
+    """Solves the game and returns the contents of the opening book file."""
+    positions = solve_opening_book()
+    data = bytearray(BOOK_HEADER_SIZE + BOOK_RECORD_COUNT * BOOK_RECORD.size)
+    BOOK_HEADER.pack_into(data, 0, OPENING_BOOK_MAGIC, OPENING_BOOK_VERSION, BOOK_RECORD.size, BOOK_RECORD_COUNT)
+    for code in range(BOOK_RECORD_COUNT):
+        key, transform = canonical_position(*decode_position(code))
+        entry = positions.get(key)
+        if entry is None: # Terminal, unreachable or opponent-to-move board
+            continue
+        score, canonical_moves = entry
+        mask = 0
+        for move_idx in canonical_moves:
+            mask |= 1 << INVERSE_SYMMETRIES[transform][move_idx]
+        BOOK_RECORD.pack_into(data, BOOK_HEADER_SIZE + code * BOOK_RECORD.size, mask, score, BOOK_VALID)
+    return bytes(data)
+
+def verify_opening_book(data):
+    """Checks opening book contents against the search.
+
+    Every record is compared with a full-window `minimax` of each move (from an
+    empty transposition table), and every reachable position must have a
+    record. Returns a list of problems, empty if the book is correct.
+    """
+    problems = []
+    transposition_table.clear()
+    for code in range(BOOK_RECORD_COUNT):
+        mask, score, flags = BOOK_RECORD.unpack_from(data, BOOK_HEADER_SIZE + code * BOOK_RECORD.size)
+        if not flags:
+            continue
+        ai_bits, opp_bits = decode_position(code)
+        scores = {move_idx: minimax(_bits_to_board(ai_bits | MOVE_BITS[move_idx], opp_bits), 0, False,
+                                    -math.inf, math.inf, 'O', 'X')
+                  for move_idx in MOVES_FOR[FULL_BOARD & ~(ai_bits | opp_bits)]}
+        best_score = max(scores.values())
+        best_mask = sum(MOVE_BITS[m] for m, s in scores.items() if s == best_score)
+        if (best_mask, best_score) != (mask, score):
+            problems.append(f"code {code}: book has moves {MOVES_FOR[mask]} scoring {score}, "
+                            f"search has {MOVES_FOR[best_mask]} scoring {best_score}")
+    for board in reachable_positions('O', 'X'):
+        code = encode_position(board_to_bits(board, 'O'), board_to_bits(board, 'X'))
+        if not BOOK_RECORD.unpack_from(data, BOOK_HEADER_SIZE + code * BOOK_RECORD.size)[2]:
+            problems.append(f"code {code}: reachable position missing from the book")
+    return problems
+
+def build_opening_book(path=OPENING_BOOK_PATH):
+    """Solves the game, verifies the result and writes the opening book to `path`.
+
+    The file is replaced atomically, so running workers keep their current
+    mapping until they reload. Returns the number of solved positions.
+    """
+    data = opening_book_bytes()
+    problems = verify_opening_book(data)
+    if problems:
+        raise RuntimeError(f"Opening book does not match the search ({len(problems)} problems), "
+                           f"first: {problems[0]}")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return sum(1 for code in range(BOOK_RECORD_COUNT)
+               if BOOK_RECORD.unpack_from(data, BOOK_HEADER_SIZE + code * BOOK_RECORD.size)[2])
+
+class OpeningBook:
+    """Read-only memory map of an opening book file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = BOOK_HEADER.unpack_from(self._map, 0) if len(self._map) >= BOOK_HEADER.size else None
+        expected_size = BOOK_HEADER_SIZE + BOOK_RECORD_COUNT * BOOK_RECORD.size
+        if (header != (OPENING_BOOK_MAGIC, OPENING_BOOK_VERSION, BOOK_RECORD.size, BOOK_RECORD_COUNT)
+                or len(self._map) != expected_size):
+            self._map.close()
+            raise ValueError(f"{path} is not a current opening book, rebuild it with build_book")
+
+    def lookup(self, ai_bits, opp_bits):
+        """Returns (best_move_mask, score) for a position, or None if it is not in the book."""
+        mask, score, flags = BOOK_RECORD.unpack_from(
+            self._map, BOOK_HEADER_SIZE + encode_position(ai_bits, opp_bits) * BOOK_RECORD.size)
+        return (mask, score) if flags else None
+
+    @property
+    def buffer(self):
+        """The whole mapped file, header included (e.g. for numpy.frombuffer)."""
+        return self._map
+
+def load_opening_book(path=OPENING_BOOK_PATH):
+    """Maps the opening book, or returns None if it has not been built."""
+    try:
+        return OpeningBook(path)
+    except (OSError, ValueError):
+        return None
+
+OPENING_BOOK = load_opening_book()
+
+def _book_move_bits(ai_bits, opp_bits, rng):
+    entry = OPENING_BOOK.lookup(ai_bits, opp_bits)
+    if entry is None: # e.g. a position that cannot arise in a legal game
+        return None
+    return rng.choice(MOVES_FOR[entry[0]]) # Keep randomness among equally good moves
+
+def book_move(board, ai_player_symbol, human_player_symbol, rng=random):
+    """Returns a perfect-play move from the opening book, or None if the position is not in it."""
+    if OPENING_BOOK is None:
+        return None
+    return _book_move_bits(board_to_bits(board, ai_player_symbol), board_to_bits(board, human_player_symbol), rng)
+
+def book_move_bits(ai_bits, opp_bits, rng=random):
+    """Bitboard counterpart of `book_move`."""
+    if OPENING_BOOK is None:
+        return None
+    return _book_move_bits(ai_bits, opp_bits, rng)
+
+# --- 4. Agents and Warm-up ---
+def random_move_agent(board, player_symbol, rng=random):
+    available_moves = get_available_moves(board)
+    if available_moves:
+        return rng.choice(available_moves)
+    return -1
+
+def reachable_positions(ai_player_symbol, human_player_symbol):
+    """Lists every distinct non-terminal board the AI can face in a legal game.
+
+    Covers both the AI moving first and the AI moving second.
+    """
+    seen = set()
+    positions = []
+
+    def visit(board, ai_to_move):
+        if (check_winner(board, ai_player_symbol) or check_winner(board, human_player_symbol)
+                or is_board_full(board)):
+            return
+        if ai_to_move:
+            board_tuple = tuple(board)
+            if board_tuple in seen:
+                return
+            seen.add(board_tuple)
+            positions.append(board)
+        mover = ai_player_symbol if ai_to_move else human_player_symbol
+        for move_idx in get_available_moves(board):
+            visit(make_move(board, move_idx, mover), not ai_to_move)
+
+    visit([EMPTY] * 9, True)
+    visit([EMPTY] * 9, False)
+    return positions
+
+def warm_up_engine():
+    """Fills the transposition table with every position reachable from an empty board.
+
+    Solving the opening for both move orders visits (through symmetry) every
+    position the AI can face, so later searches are answered from the table.
+    """
+    find_best_move([EMPTY] * 9, 'X', 'O', use_book=False) # AI moves first
+    for opening_move in range(9):                         # AI moves second
+        board = make_move([EMPTY] * 9, opening_move, 'X')
+        find_best_move(board, 'O', 'X', use_book=False)
+    transposition_table.warm = True
+    return transposition_table.stats()
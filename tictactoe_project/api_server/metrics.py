@@ -0,0 +1,148 @@
+# api_server/metrics.py
+# Minimal Prometheus-style metrics: counters, histograms and gauges read at
+# scrape time, rendered in the text exposition format for GET /metrics.
+# Recording is a lock, a dict lookup and (for histograms) a bisect over the
+# bucket bounds, so it stays on in production. Metrics are per process: under
+# `serve --workers N`, each scrape reports the worker that answered it.
+# Counters and histograms can also be drained in one process and merged into
+# another, which is how the async server's search workers report theirs.
+import bisect
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds, from 10 microseconds (book lookups) up to the largest search budget.
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+NODE_BUCKETS = (0, 10, 30, 100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def drain(self):
+        """Returns the values counted since the last drain and resets them."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        """Adds values from another process's `drain()`."""
+        with self._lock:
+            for labelvalues, value in values.items():
+                self._values[labelvalues] = self._values.get(labelvalues, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.labelnames, values)} {_number(value)}' for values, value in items)
+        return lines
+
+class Histogram:
+    """Buckets are stored non-cumulative ([count per bucket..., +Inf]) and
+    summed up only when rendered."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(buckets)
+        self._series = {} # labelvalues -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.bounds) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def drain(self):
+        """Returns the observations since the last drain and resets them."""
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series):
+        """Adds observations from another process's `drain()` (same buckets)."""
+        with self._lock:
+            for labelvalues, (buckets, total, count) in series.items():
+                mine = self._series.get(labelvalues)
+                if mine is None:
+                    mine = self._series[labelvalues] = [[0] * (len(self.bounds) + 1), 0, 0]
+                mine[0] = [a + b for a, b in zip(mine[0], buckets)]
+                mine[1] += total
+                mine[2] += count
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((values, (list(s[0]), s[1], s[2])) for values, s in self._series.items())
+        for values, (buckets, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.bounds + (float('inf'),), buckets):
+                cumulative += bucket_count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {_number(float(total))}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {count}')
+        return lines
+
+class GaugeFunction:
+    """A gauge (or counter, with metric_type='counter') whose samples are read
+    from `collect()` at scrape time, as [(labelvalues, value), ...]."""
+
+    def __init__(self, name, documentation, labelnames, collect, metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        lines.extend(f'{self.name}{_labels(self.labelnames, values)} {_number(value)}'
+                     for values, value in self.collect())
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
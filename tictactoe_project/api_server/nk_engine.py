@@ -0,0 +1,326 @@
+# api_server/nk_engine.py
+# Search engine for larger boards: N x N where k in a row wins (4x4, 5x5,
+# gomoku-style 15x15 with 5 in a row, ...). A full search is impossible on
+# those boards, so the engine runs iterative deepening alpha-beta within a
+# time/node budget and scores positions at the depth limit heuristically.
+# The 3x3 game keeps using engine.py, which solves it exactly.
+import functools
+import os
+import random
+import time
+from collections import namedtuple
+
+from engine import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable, board_to_bits
+
+MIN_BOARD_SIZE = 3
+MAX_BOARD_SIZE = 15
+DEFAULT_BUDGET_MS = float(os.environ.get('TTT_DEFAULT_BUDGET_MS', 200))
+MAX_BUDGET_MS = float(os.environ.get('TTT_MAX_BUDGET_MS', 5000))
+
+# Scores are from the side to move's point of view. A win found `ply` plies
+# from the root scores WIN_SCORE - ply, so faster wins are preferred; anything
+# above MATE_THRESHOLD is a forced result rather than a heuristic estimate.
+WIN_SCORE = 1 << 50
+MATE_THRESHOLD = WIN_SCORE - MAX_BOARD_SIZE * MAX_BOARD_SIZE - 1
+TIME_CHECK_INTERVAL = 32 # Nodes between clock checks on boards up to 4x4 (must be a power of two)
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+class BoardGeometry:
+    """Precomputed win lines of an N x N board with k in a row to win.
+
+    Boards are bitboards (bit r * size + c = cell (r, c)). `win_masks` holds
+    every k-cell segment in the four directions and `lines_through[cell]` the
+    ones that contain `cell`, so a win can be checked from the last move only.
+    """
+
+    def __init__(self, size, win_length):
+        self.size = size
+        self.win_length = win_length
+        self.cells = size * size
+        self.full = (1 << self.cells) - 1
+        # A node costs roughly in proportion to the number of cells (move
+        # generation, ordering and evaluation all scan the board), so larger
+        # boards check the clock more often to keep overshoot within budget.
+        interval = max(1, TIME_CHECK_INTERVAL * 16 // self.cells)
+        self.time_check_mask = min(TIME_CHECK_INTERVAL, 1 << (interval.bit_length() - 1)) - 1
+        masks = []
+        for row in range(size):
+            for col in range(size):
+                for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_row, end_col = row + d_row * (win_length - 1), col + d_col * (win_length - 1)
+                    if 0 <= end_row < size and 0 <= end_col < size:
+                        masks.append(sum(1 << ((row + d_row * i) * size + col + d_col * i)
+                                         for i in range(win_length)))
+        self.win_masks = tuple(masks)
+        self.lines_through = tuple(tuple(m for m in masks if m >> cell & 1) for cell in range(self.cells))
+        # On large boards only cells next to a stone are worth trying.
+        if size > 5:
+            self.neighborhoods = tuple(
+                sum(1 << (r * size + c)
+                    for r in range(max(0, cell // size - 1), min(size, cell // size + 2))
+                    for c in range(max(0, cell % size - 1), min(size, cell % size + 2)))
+                for cell in range(self.cells))
+        else:
+            self.neighborhoods = None
+        center = (size - 1) / 2
+        self.center_cell = (size // 2) * size + size // 2
+        # Cells from the centre outwards, the default order for trying moves.
+        self.cells_by_centrality = tuple(sorted(
+            range(self.cells), key=lambda cell: max(abs(cell // size - center), abs(cell % size - center))))
+
+    def is_win_after(self, bits, cell):
+        """True if the stones in `bits` complete a line through `cell`."""
+        for mask in self.lines_through[cell]:
+            if bits & mask == mask:
+                return True
+        return False
+
+    def has_won(self, bits):
+        for mask in self.win_masks:
+            if bits & mask == mask:
+                return True
+        return False
+
+    def check_winner(self, board, player):
+        """List-board counterpart of engine.check_winner for this geometry."""
+        return self.has_won(board_to_bits(board, player))
+
+    def candidate_moves(self, me, opp):
+        """Empty cells worth searching, in centre-first order."""
+        occupied = me | opp
+        empty = self.full & ~occupied
+        if self.neighborhoods is not None:
+            if not occupied:
+                return [self.center_cell]
+            near = 0
+            bits = occupied
+            while bits:
+                low = bits & -bits
+                near |= self.neighborhoods[low.bit_length() - 1]
+                bits ^= low
+            empty &= near
+        return [cell for cell in self.cells_by_centrality if empty >> cell & 1]
+
+    def evaluate(self, me, opp):
+        """Heuristic score for the side to move (`me`).
+
+        Every win line still open to only one player is worth 4**stones to
+        that player, so longer unblocked runs dominate.
+        """
+        score = 0
+        for mask in self.win_masks:
+            mine = me & mask
+            theirs = opp & mask
+            if mine and not theirs:
+                score += 4 ** _popcount(mine)
+            elif theirs and not mine:
+                score -= 4 ** _popcount(theirs)
+        return score
+
+@functools.lru_cache(maxsize=32)
+def get_geometry(size, win_length):
+    return BoardGeometry(size, win_length)
+
+# Shared across requests like engine.transposition_table. Keys include the
+# geometry, values are (depth, score, flag, best_move) with mate scores made
+# relative to the position (see _score_to_tt).
+NK_TRANSPOSITION_TABLE_SIZE = int(os.environ.get('TTT_NK_TT_SIZE', 500000))
+nk_transposition_table = TranspositionTable(NK_TRANSPOSITION_TABLE_SIZE)
+
+def _score_to_tt(score, ply):
+    if score > MATE_THRESHOLD:
+        return score + ply
+    if score < -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+def _score_from_tt(value, ply):
+    if value > MATE_THRESHOLD:
+        return value - ply
+    if value < -MATE_THRESHOLD:
+        return value + ply
+    return value
+
+nodes_searched = 0 # Total over all searches, like engine.nodes_searched
+
+SearchResult = namedtuple('SearchResult', ['move', 'score', 'depth', 'nodes', 'elapsed_ms', 'complete'])
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time or node budget runs out (or it is cancelled)."""
+
+class _Search:
+    """State of one move decision: geometry, budget, node count and the
+    killer/history move-ordering tables (kept across deepening iterations)."""
+
+    def __init__(self, geometry, deadline, max_nodes, cancel=None):
+        self.geometry = geometry
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.cancel = cancel
+        self.nodes = 0
+        self.killers = {} # ply -> last two moves that caused a beta cutoff there
+        self.history = {} # cell -> sum of depth**2 over its beta cutoffs
+
+    def ordered_moves(self, me, opp, ply, tt_move):
+        """Candidate moves for `me`, most promising first.
+
+        An immediate win is returned on its own. Otherwise: the transposition
+        table move, moves that block an opponent win, killer moves, then the
+        rest by history score. The sort is stable, so ties keep the
+        centre-first order of candidate_moves.
+        """
+        geometry = self.geometry
+        moves = geometry.candidate_moves(me, opp)
+        if len(moves) < 2:
+            return moves
+        killers = self.killers.get(ply, ())
+        history = self.history
+
+        def priority(move):
+            if move == tt_move:
+                return (3, 0)
+            if geometry.is_win_after(opp | (1 << move), move):
+                return (2, 0)
+            if move in killers:
+                return (1, 0)
+            return (0, history.get(move, 0))
+
+        for move in moves:
+            if geometry.is_win_after(me | (1 << move), move):
+                return [move]
+        moves.sort(key=priority, reverse=True)
+        return moves
+
+    def record_cutoff(self, move, ply, depth):
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        self.history[move] = self.history.get(move, 0) + depth * depth
+
+    def negamax(self, me, opp, last_move, depth, ply, alpha, beta):
+        """Alpha-beta negamax. `opp` has just played `last_move`; `me` is to move."""
+        self.nodes += 1
+        geometry = self.geometry
+        if self.nodes & geometry.time_check_mask == 0:
+            if (time.perf_counter() > self.deadline or (self.max_nodes and self.nodes > self.max_nodes)
+                    or (self.cancel is not None and self.cancel.is_set())):
+                raise SearchTimeout()
+
+        if geometry.is_win_after(opp, last_move):
+            return -(WIN_SCORE - ply)
+        if me | opp == geometry.full:
+            return 0
+        if depth == 0:
+            return geometry.evaluate(me, opp)
+
+        key = (geometry.size, geometry.win_length, me, opp)
+        entry = nk_transposition_table.get(key)
+        tt_move = None
+        if entry is not None:
+            if entry[0] >= depth:
+                value = _score_from_tt(entry[1], ply)
+                flag = entry[2]
+                if flag == EXACT:
+                    return value
+                if flag == LOWER_BOUND:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+            tt_move = entry[3]
+
+        alpha_orig = alpha
+        best = -WIN_SCORE - 1
+        best_move = None
+        for move in self.ordered_moves(me, opp, ply, tt_move):
+            score = -self.negamax(opp, me | (1 << move), move, depth - 1, ply + 1, -beta, -alpha)
+            if score > best:
+                best = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.record_cutoff(move, ply, depth)
+                break
+
+        if best <= alpha_orig:
+            flag = UPPER_BOUND
+        elif best >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        nk_transposition_table.store(key, depth, _score_to_tt(best, ply), flag, best_move)
+        return best
+
+def _is_proven(score, depth):
+    """True if a root `score` from a depth-`depth` iteration is an exact
+    forced result. Scores read from the transposition table can carry a mate
+    found by a deeper search; unless the mate is within `depth` plies, a
+    faster one may still be hiding in lines this iteration did not reach."""
+    return abs(score) > MATE_THRESHOLD and WIN_SCORE - abs(score) <= depth
+
+def find_best_move_nk(board, ai_player_symbol, human_player_symbol, size, win_length,
+                      budget_ms=None, max_nodes=None, rng=random, max_depth=None, cancel=None):
+    """Picks the AI's move on an N x N, k-in-a-row board within a search budget.
+
+    Searches depth 1, 2, 3, ... until the time budget (`budget_ms`, default
+    DEFAULT_BUDGET_MS) or `max_nodes` runs out, a forced result is found, the
+    whole game tree has been searched or `max_depth` is reached, and returns
+    the best move of the deepest completed iteration as a SearchResult.
+    `cancel` (anything with `is_set()`, e.g. a threading.Event) stops the
+    search early the same way the budget does.
+
+    Each iteration searches the previous best move first with a full window
+    and the others with the window (best - 1, inf), so worse moves fail low
+    cheaply while moves that tie the best still get exact scores; the move is
+    picked with `rng` among those ties.
+    """
+    return find_best_move_nk_bits(board_to_bits(board, ai_player_symbol), board_to_bits(board, human_player_symbol),
+                                  size, win_length, budget_ms, max_nodes, rng, max_depth, cancel)
+
+def find_best_move_nk_bits(me, opp, size, win_length, budget_ms=None, max_nodes=None, rng=random, max_depth=None,
+                           cancel=None):
+    """Bitboard counterpart of `find_best_move_nk`; `me` is the AI's stones."""
+    start = time.perf_counter()
+    budget_ms = DEFAULT_BUDGET_MS if budget_ms is None else budget_ms
+    geometry = get_geometry(size, win_length)
+    search = _Search(geometry, start + budget_ms / 1000, max_nodes, cancel)
+
+    root_moves = geometry.candidate_moves(me, opp)
+    if not root_moves:
+        return SearchResult(-1, 0, 0, 0, 0.0, True)
+    root_moves = search.ordered_moves(me, opp, 0, None) if len(root_moves) > 1 else root_moves
+
+    best_move, best_score, completed_depth = root_moves[0], None, 0
+    empty_cells = geometry.cells - _popcount(me | opp)
+    max_depth = empty_cells if max_depth is None else min(max_depth, empty_cells)
+    for depth in range(1, max_depth + 1):
+        try:
+            iteration_score, iteration_moves = -WIN_SCORE - 1, []
+            for move in root_moves:
+                alpha = iteration_score - 1 if iteration_moves else -WIN_SCORE - 1
+                score = -search.negamax(opp, me | (1 << move), move, depth - 1, 1, -WIN_SCORE - 1, -alpha)
+                if score > iteration_score:
+                    iteration_score, iteration_moves = score, [move]
+                elif score == iteration_score:
+                    iteration_moves.append(move)
+        except SearchTimeout:
+            break
+        # Ties are drawn from a canonical order, not the search order, so a
+        # seeded `rng` picks the same move for the same search result.
+        best_move, best_score, completed_depth = rng.choice(sorted(iteration_moves)), iteration_score, depth
+        # Search last iteration's best move first next time.
+        root_moves.remove(best_move)
+        root_moves.insert(0, best_move)
+        if _is_proven(best_score, depth):
+            break
+
+    global nodes_searched
+    nodes_searched += search.nodes
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    complete = completed_depth == empty_cells or (best_score is not None and _is_proven(best_score, completed_depth))
+    return SearchResult(best_move, best_score, completed_depth, search.nodes, elapsed_ms, complete)
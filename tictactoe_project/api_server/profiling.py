@@ -0,0 +1,145 @@
+# api_server/profiling.py
+# Opt-in cProfile hooks for the API. TTT_PROFILING selects the mode:
+#   off     (default) nothing is installed, so requests pay no cost at all
+#   header  requests sent with an `X-Profile: 1` header are profiled
+#   all     every request is profiled
+# In 'header' and 'all' modes, POST /profile {"seconds": N} also profiles
+# every request for the next N seconds into one combined file.
+#
+# Profiles are written in the standard pstats format to TTT_PROFILE_DIR
+# (default api_server/profiles/). The file name is returned in the
+# X-Profile-File response header. Open a profile with `python -m pstats FILE`
+# or a viewer such as snakeviz.
+import cProfile
+import os
+import pstats
+import re
+import threading
+import time
+
+PROFILING_MODE = os.environ.get('TTT_PROFILING', 'off')
+PROFILING_MODES = ('off', 'header', 'all')
+PROFILE_DIR = os.environ.get('TTT_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_HEADER = 'X-Profile'
+PROFILE_FILE_HEADER = 'X-Profile-File'
+MAX_WINDOW_SECONDS = 600
+
+def print_profile(profile_or_path, sort='cumulative', limit=25):
+    """Prints the `limit` most expensive functions of a profile."""
+    pstats.Stats(profile_or_path).strip_dirs().sort_stats(sort).print_stats(limit)
+
+class RequestProfiler:
+    """Profiles requests and writes each profile (or each window's combined
+    profile) to `directory`.
+
+    Only one request is profiled at a time: cProfile cannot profile two
+    threads of a process at once (Python 3.12+ refuses to), so a request
+    that arrives while another is being profiled runs unprofiled.
+    """
+
+    def __init__(self, mode, directory=PROFILE_DIR):
+        if mode not in PROFILING_MODES:
+            raise ValueError(f"Unknown TTT_PROFILING mode {mode!r}; expected one of {', '.join(PROFILING_MODES)}.")
+        self.mode = mode
+        self.directory = directory
+        self._busy = threading.Lock()
+        self._lock = threading.Lock() # Guards the window state and the file counter
+        self._count = 0
+        self._window_until = 0.0
+        self._window_stats = None
+        self._window_path = None
+
+    def _new_path(self, label):
+        with self._lock:
+            self._count += 1
+            count = self._count
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_') or 'root'
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{count}-{slug}.prof")
+
+    def start_window(self, seconds):
+        """Profiles every request for the next `seconds`; returns the file the
+        combined profile is written to (updated after each request)."""
+        path = self._new_path(f'window_{seconds:g}s')
+        with self._lock:
+            self._window_until = time.monotonic() + seconds
+            self._window_stats = None
+            self._window_path = path
+        return path
+
+    def window_active(self):
+        return time.monotonic() < self._window_until
+
+    def should_profile(self, headers):
+        return self.mode == 'all' or headers.get(PROFILE_HEADER, '') not in ('', '0') or self.window_active()
+
+    def start(self):
+        """Returns an enabled cProfile.Profile, or None if one is already running."""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, label):
+        """Stops `profile` and saves it; returns the path written."""
+        profile.disable()
+        self._busy.release()
+        with self._lock:
+            if self.window_active():
+                if self._window_stats is None:
+                    self._window_stats = pstats.Stats(profile)
+                else:
+                    self._window_stats.add(profile)
+                self._window_stats.dump_stats(self._window_path)
+                return self._window_path
+        path = self._new_path(label)
+        profile.dump_stats(path)
+        return path
+
+    def abandon(self, profile):
+        """Stops a profile without saving it (the request failed)."""
+        profile.disable()
+        self._busy.release()
+
+def install_request_profiling(app, mode=PROFILING_MODE, directory=PROFILE_DIR):
+    """Adds profiling hooks and POST /profile to a Flask `app`, unless `mode`
+    is 'off'. Returns the RequestProfiler, or None when off."""
+    if mode == 'off':
+        return None
+    from flask import g, jsonify, request
+
+    profiler = RequestProfiler(mode, directory)
+
+    @app.before_request
+    def _start_profile():
+        if profiler.should_profile(request.headers):
+            g.profile = profiler.start()
+
+    @app.after_request
+    def _save_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            label = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            response.headers[PROFILE_FILE_HEADER] = os.path.basename(profiler.stop(profile, label))
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(_exc):
+        profile = g.pop('profile', None)
+        if profile is not None: # after_request did not run
+            profiler.abandon(profile)
+
+    @app.route('/profile', methods=['POST'])
+    def profile_window_api():
+        """Profiles every request for the next {"seconds": N} into one file."""
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Invalid input. Expected {\"seconds\": N}."}), 400
+        seconds = data.get('seconds')
+        if not isinstance(seconds, (int, float)) or isinstance(seconds, bool) or not 0 < seconds <= MAX_WINDOW_SECONDS:
+            return jsonify({"error": f"Invalid 'seconds' provided. Must be a number up to {MAX_WINDOW_SECONDS}."}), 400
+        path = profiler.start_window(seconds)
+        return jsonify({"status": "success", "profile_file": os.path.basename(path), "seconds": seconds}), 200
+
+    return profiler
@@ -0,0 +1,254 @@
+# api_server/sessions.py
+# Stateful game sessions: the server keeps each game's position, so a client
+# creates a game once and then only sends the opponent's next move. A game is
+# stored compactly as two bitboards plus its settings. Each update applies the
+# one incoming move and checks only the lines through it for a win, then lets
+# the AI reply from the same bitboards. The engines' transposition tables are
+# shared and keyed by position, so what the search stored while choosing the
+# AI's last move is found again on the next turn.
+#
+# Sessions live in a pluggable store with TTL-based eviction:
+#   InMemorySessionStore  per process (the default)
+#   SqliteSessionStore    a local database file, shared by all worker processes
+import json
+import os
+import random
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from engine import EMPTY, IS_WINNING, find_best_move_bits
+from nk_engine import get_geometry, find_best_move_nk_bits
+
+SESSION_TTL = float(os.environ.get('TTT_SESSION_TTL', 3600))      # Seconds a game is kept after its last update
+MAX_SESSIONS = int(os.environ.get('TTT_MAX_SESSIONS', 100000))    # In-memory store only
+SESSION_STORE = os.environ.get('TTT_SESSION_STORE', 'memory')     # 'memory' or 'sqlite'
+SESSION_DB_PATH = os.environ.get(
+    'TTT_SESSION_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.db'))
+
+# `ply` counts the stones on the board; stores use it to reject an update
+# based on a stale copy of the game. `winner` is None while the game is on,
+# otherwise the winning symbol or 'tie'.
+GameState = namedtuple('GameState', ['ai_bits', 'opp_bits', 'board_size', 'win_length', 'ai_symbol',
+                                     'opponent_symbol', 'budget_ms', 'ply', 'winner'])
+
+class SessionConflict(Exception):
+    """Raised when a game was updated by another request in the meantime."""
+
+# --- Game logic ---
+def board_of(state):
+    """The game as a list board, the format the rest of the API uses."""
+    return [state.ai_symbol if state.ai_bits >> i & 1 else state.opponent_symbol if state.opp_bits >> i & 1
+            else EMPTY for i in range(state.board_size * state.board_size)]
+
+def _completes_line(state, bits, move):
+    """True if the stones in `bits` (which include `move`) have won."""
+    if state.board_size == 3: # Classic game: one table lookup
+        return IS_WINNING[bits]
+    return get_geometry(state.board_size, state.win_length).is_win_after(bits, move)
+
+def _place(state, move, by_ai):
+    """Returns the state after `by_ai`'s stone goes on `move` (assumed empty)."""
+    bit = 1 << move
+    if by_ai:
+        state = state._replace(ai_bits=state.ai_bits | bit, ply=state.ply + 1)
+        won = _completes_line(state, state.ai_bits, move)
+    else:
+        state = state._replace(opp_bits=state.opp_bits | bit, ply=state.ply + 1)
+        won = _completes_line(state, state.opp_bits, move)
+    if won:
+        return state._replace(winner=state.ai_symbol if by_ai else state.opponent_symbol)
+    if state.ply == state.board_size * state.board_size:
+        return state._replace(winner='tie')
+    return state
+
+def ai_turn(state, rng=random, search_state=None):
+    """Plays the AI's move. Returns (state, move, search_info), where
+    search_info is None for the classic game (solved exactly); its search
+    counts into `search_state` if one is given."""
+    if (state.board_size, state.win_length) == (3, 3):
+        move = find_best_move_bits(state.ai_bits, state.opp_bits, rng, search_state=search_state)
+        return _place(state, move, True), move, None
+    result = find_best_move_nk_bits(state.ai_bits, state.opp_bits, state.board_size, state.win_length,
+                                    state.budget_ms, rng=rng)
+    search_info = {"depth": result.depth, "nodes": result.nodes,
+                   "elapsed_ms": round(result.elapsed_ms, 2), "complete": result.complete}
+    return _place(state, result.move, True), result.move, search_info
+
+def new_game(board_size, win_length, ai_symbol, opponent_symbol, budget_ms=None, ai_starts=False, rng=random):
+    """Starts a game. Returns (state, ai_move, search_info); ai_move is None
+    unless the AI plays first."""
+    state = GameState(0, 0, board_size, win_length, ai_symbol, opponent_symbol, budget_ms, 0, None)
+    if ai_starts:
+        return ai_turn(state, rng)
+    return state, None, None
+
+def play_move(state, move, rng=random, search_state=None):
+    """Applies the opponent's `move` and, unless that ends the game, the AI's
+    reply. Returns (state, ai_move, search_info); raises ValueError for a
+    move that is not allowed."""
+    if state.winner is not None:
+        raise ValueError("The game is already over.")
+    cell_count = state.board_size * state.board_size
+    if not isinstance(move, int) or isinstance(move, bool) or not 0 <= move < cell_count:
+        raise ValueError(f"Invalid 'move' provided. Must be a cell index from 0 to {cell_count - 1}.")
+    if (state.ai_bits | state.opp_bits) >> move & 1:
+        raise ValueError(f"Cell {move} is already taken.")
+    state = _place(state, move, False)
+    if state.winner is not None:
+        return state, None, None
+    return ai_turn(state, rng, search_state)
+
+# --- Session stores ---
+class InMemorySessionStore:
+    """Sessions in a dict in this process, evicted `ttl` seconds after their
+    last update (and oldest first beyond `max_sessions`).
+
+    Every write moves a session to the end, so the dict stays ordered by
+    expiry time and purging only ever looks at the front.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict() # session_id -> (expires_at, state)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _purge(self, now):
+        while self._sessions:
+            session_id, (expires_at, _state) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+    def create(self, state):
+        session_id = secrets.token_urlsafe(16)
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (now + self.ttl, state)
+            self._purge(now)
+        return session_id
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] <= time.time():
+                return None
+            return entry[1]
+
+    def update(self, session_id, state, expected_ply):
+        """Stores `state` if the stored game is still at `expected_ply`;
+        raises SessionConflict otherwise and KeyError if it has expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or entry[0] <= now:
+                raise KeyError(session_id)
+            if entry[1].ply != expected_ply:
+                raise SessionConflict(session_id)
+            self._sessions[session_id] = (now + self.ttl, state)
+            self._sessions.move_to_end(session_id)
+            self._purge(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            self._purge(time.time())
+            return {"backend": self.backend, "active": len(self._sessions), "ttl_seconds": self.ttl,
+                    "evictions": self.evictions}
+
+class SqliteSessionStore:
+    """Sessions in a local SQLite file, so every worker process of the server
+    sees the same games. Expired rows are deleted at most once per
+    `purge_interval` seconds, and ignored on read until then.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL, purge_interval=60):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._local = threading.local() # One connection per thread
+        self._last_purge = 0.0
+        # The store is usually created at import time, before `serve` forks
+        # its workers, so the setup connection is not kept.
+        conn = self._connect()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+                         '(id TEXT PRIMARY KEY, ply INTEGER NOT NULL, state TEXT NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)')
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL') # Readers don't block the writer
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self):
+        """This thread's connection. SQLite connections must not be used
+        across fork(), so one inherited from a parent process is abandoned
+        (not closed, which could touch the parent's locks) and reopened."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    def _purge(self, conn, now):
+        if now - self._last_purge >= self.purge_interval:
+            self._last_purge = now
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+    def create(self, state):
+        session_id = secrets.token_urlsafe(16)
+        now = time.time()
+        with self._connection() as conn:
+            self._purge(conn, now)
+            conn.execute('INSERT INTO sessions (id, ply, state, expires_at) VALUES (?, ?, ?, ?)',
+                         (session_id, state.ply, json.dumps(state), now + self.ttl))
+        return session_id
+
+    def get(self, session_id):
+        row = self._connection().execute('SELECT state FROM sessions WHERE id = ? AND expires_at > ?',
+                                         (session_id, time.time())).fetchone()
+        return GameState(*json.loads(row[0])) if row else None
+
+    def update(self, session_id, state, expected_ply):
+        """Same contract as InMemorySessionStore.update."""
+        now = time.time()
+        with self._connection() as conn:
+            cursor = conn.execute('UPDATE sessions SET ply = ?, state = ?, expires_at = ? '
+                                  'WHERE id = ? AND ply = ? AND expires_at > ?',
+                                  (state.ply, json.dumps(state), now + self.ttl, session_id, expected_ply, now))
+            if cursor.rowcount == 0:
+                exists = conn.execute('SELECT 1 FROM sessions WHERE id = ? AND expires_at > ?',
+                                      (session_id, now)).fetchone()
+                raise SessionConflict(session_id) if exists else KeyError(session_id)
+
+    def delete(self, session_id):
+        with self._connection() as conn:
+            return conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,)).rowcount > 0
+
+    def stats(self):
+        active = self._connection().execute('SELECT COUNT(*) FROM sessions WHERE expires_at > ?',
+                                            (time.time(),)).fetchone()[0]
+        return {"backend": self.backend, "active": active, "ttl_seconds": self.ttl, "path": self.path}
+
+SESSION_STORES = {'memory': InMemorySessionStore, 'sqlite': SqliteSessionStore}
+
+def create_session_store(backend=SESSION_STORE):
+    """Builds the store named by TTT_SESSION_STORE ('memory' or 'sqlite')."""
+    if backend not in SESSION_STORES:
+        raise ValueError(f"Unknown session store {backend!r}; expected one of {', '.join(SESSION_STORES)}.")
+    return SESSION_STORES[backend]()
@@ -0,0 +1,497 @@
+# api_server/simulation.py
+# AI vs random-agent simulations. NumPy is needed here, matplotlib only when
+# charts are drawn, so neither is loaded by the API server.
+import csv
+import json
+import random
+import sys
+import time
+import multiprocessing
+from collections import deque
+import numpy as np
+
+from engine import (
+    EMPTY, WIN_LINES, BOOK_HEADER_SIZE, BOOK_RECORD_COUNT, check_winner, is_board_full, make_move,
+    find_best_move, random_move_agent, opening_book_bytes,
+)
+import engine
+
+# --- Simulation (AI vs Random Agent) ---
+def simulate_games_main(num_games, ai_starts_first, ai_player_char='O', opponent_char='X',
+                        rng=random, move_histograms=None, verbose=True):
+    # (This is the simulate_games function from your original script)
+    # `rng` drives both players' random choices so a seeded run is reproducible.
+    # If `move_histograms` is given ({"ai": [0]*9, "opponent": [0]*9}), the
+    # cell chosen by each player on every move is counted into it.
+    ai_wins = 0
+    opponent_wins = 0
+    ties = 0
+    if verbose:
+        print(f"Simulating {num_games} games. AI ({ai_player_char}) vs Random Agent ({opponent_char}). AI starts first: {ai_starts_first}")
+    for i in range(num_games):
+        board = [EMPTY] * 9
+        current_player_is_ai = ai_starts_first
+        game_over = False
+        if verbose and (i + 1) % (num_games // 10 if num_games >=10 else 1) == 0:
+            print(f"  Simulating game {i+1}/{num_games}...")
+        while not game_over:
+            if current_player_is_ai:
+                move = find_best_move(board, ai_player_char, opponent_char, rng)
+                if move_histograms is not None:
+                    move_histograms["ai"][move] += 1
+                board = make_move(board, move, ai_player_char)
+                if check_winner(board, ai_player_char):
+                    ai_wins += 1
+                    game_over = True
+            else:
+                move = random_move_agent(board, opponent_char, rng)
+                if move != -1:
+                    if move_histograms is not None:
+                        move_histograms["opponent"][move] += 1
+                    board = make_move(board, move, opponent_char)
+                    if check_winner(board, opponent_char):
+                        opponent_wins += 1
+                        game_over = True
+            if not game_over and is_board_full(board):
+                ties += 1
+                game_over = True
+            current_player_is_ai = not current_player_is_ai
+    return ai_wins, opponent_wins, ties
+
+# --- Vectorized Batch Simulation (NumPy) ---
+# Plays many games at once: boards are rows of an (N, 9) int8 array holding
+# 0 = empty, 1 = AI, 2 = random agent. AI moves come from a solved table
+# indexed by the base-3 code of the board (sum of cell * 3**i).
+POWERS_OF_3 = 3 ** np.arange(9)
+WIN_LINES_ARRAY = np.array(WIN_LINES)
+CELL_BITS = 1 << np.arange(9)
+BOOK_RECORD_DTYPE = np.dtype([('mask', '<u2'), ('score', 'i1'), ('flags', 'u1')]) # engine.BOOK_RECORD
+_solved_move_table = None
+
+def solved_move_table():
+    """Returns a (3**9,) uint16 array: bitmask of optimal AI moves for each board code.
+
+    Read once from the opening book's records (the book is solved in memory
+    if the file has not been built). Codes for terminal or unreachable boards hold 0.
+    """
+    global _solved_move_table
+    if _solved_move_table is None:
+        data = engine.OPENING_BOOK.buffer if engine.OPENING_BOOK is not None else opening_book_bytes()
+        records = np.frombuffer(data, dtype=BOOK_RECORD_DTYPE, count=BOOK_RECORD_COUNT, offset=BOOK_HEADER_SIZE)
+        _solved_move_table = records['mask'].copy()
+    return _solved_move_table
+
+def _pick_random_cells(candidates, rng):
+    """Picks one True cell per row of an (N, 9) bool array, uniformly at random."""
+    return np.where(candidates, rng.random(candidates.shape), -1.0).argmax(axis=1)
+
+def simulate_games_vectorized(num_games, ai_starts_first, rng=None, batch_size=100000, move_histograms=None):
+    """Same contract as `simulate_games_main`, but plays games in NumPy batches.
+
+    `rng` is a `numpy.random.Generator`. If `move_histograms` is given (a (2, 9)
+    integer array), AI moves are counted into row 0 and opponent moves into row 1.
+    Returns (ai_wins, opponent_wins, ties).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    table = solved_move_table()
+    ai_wins = opponent_wins = ties = 0
+    for start in range(0, num_games, batch_size):
+        n = min(batch_size, num_games - start)
+        boards = np.zeros((n, 9), dtype=np.int8)
+        active = np.arange(n)
+        ai_turn = ai_starts_first
+        while active.size:
+            current = boards[active]
+            if ai_turn:
+                best_masks = table[current @ POWERS_OF_3]
+                candidates = (best_masks[:, None] & CELL_BITS) != 0
+                player = 1
+            else:
+                candidates = current == 0
+                player = 2
+            moves = _pick_random_cells(candidates, rng)
+            if move_histograms is not None:
+                move_histograms[0 if ai_turn else 1] += np.bincount(moves, minlength=9)
+            current[np.arange(active.size), moves] = player
+            boards[active] = current
+
+            won = (current[:, WIN_LINES_ARRAY] == player).all(axis=2).any(axis=1)
+            full = ~won & (current != 0).all(axis=1)
+            if ai_turn:
+                ai_wins += int(won.sum())
+            else:
+                opponent_wins += int(won.sum())
+            ties += int(full.sum())
+            active = active[~(won | full)]
+            ai_turn = not ai_turn
+    return ai_wins, opponent_wins, ties
+
+# --- Parallel Simulation (multiprocessing) ---
+# Games are split into one shard per worker process. Each shard gets its own
+# child of a root SeedSequence, so the same seed and worker count always give
+# the same merged report, and each worker warms up its own engine caches.
+def _simulation_shard(shard):
+    """Plays one worker's games (half with the AI first) and returns its report."""
+    num_games, seed_sequence, vectorized = shard
+    first_half = num_games // 2
+    if vectorized:
+        rng = np.random.default_rng(seed_sequence)
+        histograms = np.zeros((2, 9), dtype=np.int64)
+        results_first = simulate_games_vectorized(first_half, True, rng, move_histograms=histograms)
+        results_second = simulate_games_vectorized(num_games - first_half, False, rng, move_histograms=histograms)
+        ai_histogram, opponent_histogram = histograms.tolist()
+    else:
+        rng = random.Random(int(seed_sequence.generate_state(1)[0]))
+        histograms = {"ai": [0] * 9, "opponent": [0] * 9}
+        results_first = simulate_games_main(first_half, True, rng=rng, move_histograms=histograms, verbose=False)
+        results_second = simulate_games_main(num_games - first_half, False, rng=rng, move_histograms=histograms, verbose=False)
+        ai_histogram, opponent_histogram = histograms["ai"], histograms["opponent"]
+    return {
+        "games": num_games,
+        "ai_wins": results_first[0] + results_second[0],
+        "opponent_wins": results_first[1] + results_second[1],
+        "ties": results_first[2] + results_second[2],
+        "ai_move_histogram": ai_histogram,
+        "opponent_move_histogram": opponent_histogram,
+    }
+
+def run_parallel_simulation(num_games, workers=1, seed=None, vectorized=False):
+    """Shards `num_games` over `workers` processes and merges their reports.
+
+    Returns a dict with the merged counts and move histograms, plus the seed
+    used (random if `seed` is None) so the run can be repeated.
+    """
+    root_seed = np.random.SeedSequence(seed)
+    shards = [(num_games // workers + (1 if i < num_games % workers else 0), child, vectorized)
+              for i, child in enumerate(root_seed.spawn(workers))]
+    if workers == 1:
+        reports = [_simulation_shard(shards[0])]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            reports = pool.map(_simulation_shard, shards)
+
+    merged = {"games": 0, "ai_wins": 0, "opponent_wins": 0, "ties": 0,
+              "ai_move_histogram": [0] * 9, "opponent_move_histogram": [0] * 9}
+    for report in reports:
+        for field in ("games", "ai_wins", "opponent_wins", "ties"):
+            merged[field] += report[field]
+        for field in ("ai_move_histogram", "opponent_move_histogram"):
+            merged[field] = [a + b for a, b in zip(merged[field], report[field])]
+    merged["workers"] = workers
+    merged["seed"] = root_seed.entropy
+    return merged
+
+# --- Streaming Simulation (per-game records) ---
+# Long runs stream one record per game (see iter_games) to an NDJSON or CSV
+# file as they are played, instead of keeping only end-of-run totals. Memory
+# stays bounded by a few chunks of games whatever the run length, progress is
+# printed as the run goes, and charts are drawn afterwards from the file.
+STREAM_FORMATS = ('ndjson', 'csv')
+STREAM_CHUNK_GAMES = 1000
+CSV_FIELDS = ('game', 'ai_first', 'result', 'plies', 'moves', 'move_ms', 'total_ms')
+
+def iter_games(num_games, ai_starts_first, ai_player_char='O', opponent_char='X', rng=random, first_game=0):
+    """Plays games one at a time and yields a record for each:
+
+        {"game": id, "ai_first": bool, "result": 'ai' | 'opponent' | 'tie',
+         "plies": n, "moves": [cell, ...], "move_ms": [ms, ...], "total_ms": ms}
+
+    `moves` are in play order (starting with whoever moved first) and
+    `move_ms[i]` is the time taken to choose `moves[i]`. Game ids start at
+    `first_game`.
+    """
+    clock = time.perf_counter_ns
+    for game in range(first_game, first_game + num_games):
+        board = [EMPTY] * 9
+        moves = []
+        move_ns = []
+        current_player_is_ai = ai_starts_first
+        result = None
+        last = clock()
+        while result is None:
+            if current_player_is_ai:
+                player = ai_player_char
+                move = find_best_move(board, ai_player_char, opponent_char, rng)
+            else:
+                player = opponent_char
+                move = random_move_agent(board, opponent_char, rng)
+            now = clock()
+            move_ns.append(now - last)
+            moves.append(move)
+            board = make_move(board, move, player)
+            if check_winner(board, player):
+                result = 'ai' if current_player_is_ai else 'opponent'
+            elif is_board_full(board):
+                result = 'tie'
+            current_player_is_ai = not current_player_is_ai
+            last = clock()
+        move_ms = [round(ns / 1e6, 4) for ns in move_ns]
+        yield {"game": game, "ai_first": ai_starts_first, "result": result, "plies": len(moves),
+               "moves": moves, "move_ms": move_ms, "total_ms": round(sum(move_ns) / 1e6, 4)}
+
+def _stream_chunk(chunk):
+    """Plays one chunk of games (in a worker process) and returns its records."""
+    first_game, num_games, ai_starts_first, seed_sequence = chunk
+    rng = random.Random(int(seed_sequence.generate_state(1)[0]))
+    return list(iter_games(num_games, ai_starts_first, rng=rng, first_game=first_game))
+
+def iter_simulation(num_games, workers=1, seed=None, chunk_games=STREAM_CHUNK_GAMES):
+    """Yields a record for each of `num_games` games in game order, half of
+    them with the AI starting. Returns the seed used, via StopIteration.value.
+
+    Games are played in chunks of `chunk_games`, each seeded by its own child
+    of the root SeedSequence, so a seed gives the same records for any number
+    of workers. Chunks alternate who starts, so running totals are
+    representative mid-run. At most two chunks per worker are in flight.
+    """
+    root_seed = np.random.SeedSequence(seed)
+    first_half = num_games // 2
+    halves = [[(min(chunk_games, first_half - start), True) for start in range(0, first_half, chunk_games)],
+              [(min(chunk_games, num_games - first_half - start), False)
+               for start in range(0, num_games - first_half, chunk_games)]]
+    chunks = []
+    first_game = 0
+    for index in range(max(len(halves[0]), len(halves[1]))):
+        for half in halves:
+            if index < len(half):
+                count, ai_starts_first = half[index]
+                chunks.append((first_game, count, ai_starts_first))
+                first_game += count
+    chunks = [chunk + (child,) for chunk, child in zip(chunks, root_seed.spawn(len(chunks)))]
+
+    if workers == 1:
+        for first_game, count, ai_starts_first, child in chunks:
+            rng = random.Random(int(child.generate_state(1)[0]))
+            yield from iter_games(count, ai_starts_first, rng=rng, first_game=first_game)
+        return root_seed.entropy
+
+    pending = deque()
+    with multiprocessing.Pool(workers) as pool:
+        for chunk in chunks:
+            pending.append(pool.apply_async(_stream_chunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+    return root_seed.entropy
+
+def stream_format(path, fmt=None):
+    """`fmt` if given, otherwise 'csv' for a .csv path and 'ndjson' for anything else."""
+    if fmt is None:
+        fmt = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Unknown stream format {fmt!r}; expected one of {', '.join(STREAM_FORMATS)}.")
+    return fmt
+
+class RecordWriter:
+    """Appends game records to an NDJSON or CSV file as they arrive. In CSV,
+    `moves` and `move_ms` are space-separated lists."""
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.format = stream_format(path, fmt)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        if self.format == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(CSV_FIELDS)
+
+    def write(self, record):
+        if self.format == 'ndjson':
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        else:
+            self._csv.writerow([record['game'], int(record['ai_first']), record['result'], record['plies'],
+                                ' '.join(map(str, record['moves'])), ' '.join(map(str, record['move_ms'])),
+                                record['total_ms']])
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_records(path):
+    """Yields the records of a stream file, one at a time. The format is
+    detected from the first line, so either kind can be read back."""
+    with open(path, newline='', encoding='utf-8') as f:
+        first_line = f.readline()
+        if first_line.startswith('{'):
+            yield json.loads(first_line)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        f.seek(0)
+        for row in csv.DictReader(f):
+            yield {"game": int(row['game']), "ai_first": row['ai_first'] == '1', "result": row['result'],
+                   "plies": int(row['plies']), "moves": [int(m) for m in row['moves'].split()],
+                   "move_ms": [float(t) for t in row['move_ms'].split()], "total_ms": float(row['total_ms'])}
+
+class ProgressReporter:
+    """Keeps running totals over records and prints a one-line summary at
+    most every `interval` seconds (and once more from finish())."""
+
+    def __init__(self, total, interval=5.0, out=sys.stdout):
+        self.total = total
+        self.interval = interval
+        self.out = out
+        self.counts = {"ai": 0, "opponent": 0, "tie": 0}
+        self.games = 0
+        self.moves = 0
+        self.move_ms = 0.0
+        self.start = time.perf_counter()
+        self._next_report = self.start + interval
+
+    def update(self, record):
+        self.games += 1
+        self.counts[record['result']] += 1
+        self.moves += record['plies']
+        self.move_ms += record['total_ms']
+        if self.interval and time.perf_counter() >= self._next_report:
+            self.report()
+            self._next_report = time.perf_counter() + self.interval
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.games / elapsed if elapsed > 0 else 0.0
+        games = self.games or 1
+        eta = f", ETA {(self.total - self.games) / rate:.0f}s" if rate and self.games < self.total else ''
+        print(f"[{elapsed:7.1f}s] {self.games:,}/{self.total:,} games ({rate:,.0f}/s{eta}) | "
+              f"AI {self.counts['ai'] / games:.1%}  random {self.counts['opponent'] / games:.1%}  "
+              f"tie {self.counts['tie'] / games:.1%} | mean move {self.move_ms / max(self.moves, 1):.4f} ms",
+              file=self.out, flush=True)
+
+    def finish(self):
+        self.report()
+        return {"games": self.games, "ai_wins": self.counts['ai'], "opponent_wins": self.counts['opponent'],
+                "ties": self.counts['tie'], "seconds": time.perf_counter() - self.start}
+
+def stream_simulation(num_games, path, fmt=None, workers=1, seed=None, progress_seconds=5.0, out=sys.stdout):
+    """Plays `num_games` games, writing each game's record to `path` as soon
+    as it is played and printing progress every `progress_seconds`. Returns
+    the run's totals, with the seed used."""
+    progress = ProgressReporter(num_games, progress_seconds, out)
+    records = iter_simulation(num_games, workers, seed)
+    with RecordWriter(path, fmt) as writer:
+        while True:
+            try:
+                record = next(records)
+            except StopIteration as stop:
+                used_seed = stop.value
+                break
+            writer.write(record)
+            progress.update(record)
+    summary = progress.finish()
+    summary.update(seed=used_seed, workers=workers, path=path, format=writer.format)
+    return summary
+
+def summarize_stream(path):
+    """Aggregates a stream file in one pass (memory does not grow with the
+    number of games): results, move histograms, game lengths and the AI's
+    mean time per move by ply."""
+    summary = {"games": 0, "ai_wins": 0, "opponent_wins": 0, "ties": 0,
+               "ai_move_histogram": [0] * 9, "opponent_move_histogram": [0] * 9,
+               "game_lengths": [0] * 10, "ai_ms_by_ply": [0.0] * 9, "ai_moves_by_ply": [0] * 9}
+    result_fields = {"ai": "ai_wins", "opponent": "opponent_wins", "tie": "ties"}
+    for record in read_records(path):
+        summary["games"] += 1
+        summary[result_fields[record["result"]]] += 1
+        summary["game_lengths"][record["plies"]] += 1
+        ai_parity = 0 if record["ai_first"] else 1
+        for ply, (move, ms) in enumerate(zip(record["moves"], record["move_ms"])):
+            if ply % 2 == ai_parity:
+                summary["ai_move_histogram"][move] += 1
+                summary["ai_ms_by_ply"][ply] += ms
+                summary["ai_moves_by_ply"][ply] += 1
+            else:
+                summary["opponent_move_histogram"][move] += 1
+    return summary
+
+def charts_from_stream(path, output='simulation_charts.png', show=False):
+    """Draws the charts for a stream file and saves them to `output`. Uses a
+    non-interactive backend unless `show` is set, so it runs headless."""
+    import matplotlib # Only needed for charts, so loaded on demand
+    if not show:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    summary = summarize_stream(path)
+    games = summary["games"]
+    if games == 0:
+        raise ValueError(f"No game records in {path}.")
+    fig, ((results_ax, timing_ax), (length_ax, cells_ax)) = plt.subplots(2, 2, figsize=(13, 10))
+
+    results_ax.pie([summary["ai_wins"], summary["opponent_wins"], summary["ties"]],
+                   labels=['AI Wins', 'Random Wins', 'Ties'], autopct='%1.1f%%', startangle=90,
+                   colors=['skyblue', 'lightcoral', 'lightgreen'])
+    results_ax.axis('equal')
+    results_ax.set_title(f'Overall Performance ({games} games)')
+
+    plies = [ply for ply in range(9) if summary["ai_moves_by_ply"][ply]]
+    timing_ax.bar([ply + 1 for ply in plies],
+                  [summary["ai_ms_by_ply"][ply] / summary["ai_moves_by_ply"][ply] for ply in plies], color='skyblue')
+    timing_ax.set_title('AI Mean Time per Move')
+    timing_ax.set_xlabel('Move number')
+    timing_ax.set_ylabel('ms')
+
+    length_ax.bar(range(10), summary["game_lengths"], color='gray')
+    length_ax.set_title('Game Length')
+    length_ax.set_xlabel('Moves played')
+    length_ax.set_ylabel('Games')
+
+    cells = np.arange(9)
+    cells_ax.bar(cells - 0.2, summary["ai_move_histogram"], 0.4, label='AI', color='skyblue')
+    cells_ax.bar(cells + 0.2, summary["opponent_move_histogram"], 0.4, label='Random', color='lightcoral')
+    cells_ax.set_xticks(cells)
+    cells_ax.set_title('Moves per Cell')
+    cells_ax.set_xlabel('Cell')
+    cells_ax.legend()
+
+    fig.tight_layout()
+    fig.savefig(output)
+    print(f"Charts for {games} games from {path} saved to {output}")
+    if show:
+        plt.show()
+    plt.close(fig)
+    return summary
+
+def run_simulations_and_charts(num_simulations=50, vectorized=False, workers=1, seed=None):
+    print("Step 1-3: Game Logic and Minimax AI are defined.")
+    print("\nStep 4: Simulating games to evaluate AI performance...")
+    NUM_SIMULATIONS = num_simulations # 50 by default for a quick demo
+    AI_PLAYER_SYMBOL_SIM = 'O'
+    RANDOM_AGENT_SYMBOL_SIM = 'X'
+
+    print(f"Simulating {NUM_SIMULATIONS} games on {workers} worker(s), half with the AI starting first...")
+    start_time = time.perf_counter()
+    report = run_parallel_simulation(NUM_SIMULATIONS, workers, seed, vectorized)
+    elapsed = time.perf_counter() - start_time
+
+    total_ai_wins = report["ai_wins"]
+    total_opp_wins = report["opponent_wins"]
+    total_ties = report["ties"]
+    total_games = report["games"]
+
+    print("\n--- Simulation Results ---")
+    print(f"Seed: {report['seed']} (workers: {workers})")
+    print(f"Total Games Played: {total_games} in {elapsed:.2f}s ({total_games / elapsed:,.0f} games/s)")
+    print(f"AI ({AI_PLAYER_SYMBOL_SIM}) Wins: {total_ai_wins} ({total_ai_wins/total_games*100:.2f}%)")
+    print(f"Random Agent ({RANDOM_AGENT_SYMBOL_SIM}) Wins: {total_opp_wins} ({total_opp_wins/total_games*100:.2f}%)")
+    print(f"Ties: {total_ties} ({total_ties/total_games*100:.2f}%)")
+    if total_games > 0:
+        accuracy = (total_ai_wins + total_ties) / total_games
+        print(f"\nMinimax AI 'Unbeatability' (Wins + Ties vs Random): {accuracy*100:.2f}%")
+    print(f"AI move histogram (cells 0-8): {report['ai_move_histogram']}")
+    print(f"Random agent move histogram (cells 0-8): {report['opponent_move_histogram']}")
+
+    import matplotlib.pyplot as plt # Only needed for charts, so loaded on demand
+
+    labels = [f'AI ({AI_PLAYER_SYMBOL_SIM}) Wins', f'Random ({RANDOM_AGENT_SYMBOL_SIM}) Wins', 'Ties']
+    sizes_total = [total_ai_wins, total_opp_wins, total_ties]
+    fig, ax = plt.subplots(figsize=(7, 7))
+    ax.pie(sizes_total, labels=labels, autopct='%1.1f%%', startangle=90, colors=['skyblue', 'lightcoral', 'lightgreen'])
+    ax.axis('equal')
+    ax.set_title(f'Overall Performance ({total_games} games)')
+    plt.show()
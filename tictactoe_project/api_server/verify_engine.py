@@ -0,0 +1,252 @@
+# api_server/verify_engine.py
+# Exhaustive check of the classic engine, meant to gate releases. Every
+# position the AI can face in a legal game is verified, for both symbol
+# assignments (AI 'X' and AI 'O'), against a reference solve: a plain
+# full-window negamax with no alpha-beta pruning and no transposition table,
+# so none of the engine's optimizations can affect it. A move is correct if
+# it is one of the reference's best moves.
+#
+# Each position is checked in four settings:
+#   cold  transposition table cleared before the position
+#   warm  table kept across the whole sweep, visited in shuffled order, so
+#         bounds stored by earlier searches are reused as in a long-running server
+#   book  the opening book lookup (when the book is loaded)
+#   nk    the N x N engine (nk_engine.py) on the 3x3 board, warm and shuffled
+#         like 'warm'; it must play a best move and report the result as exact
+# In 'cold' and 'warm', the engine's score and its full set of equally good
+# moves must match the reference too. Each position's tie-break uses its own
+# seeded rng, and every setting must choose the same move: a seed has to give
+# the same games whatever the cache holds and whether or not the book is
+# built. The time of each `find_best_move` (or
+# book lookup) call is recorded (the fastest of --repeats sweeps), so one run
+# checks correctness and speed.
+#
+#   python verify_engine.py [--output verify_results.json] [--compare old.json]
+#
+# The run exits with status 1 if any move is wrong or, with --compare, if a
+# tracked timing got worse than the baseline by more than --tolerance.
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import engine
+from engine import (
+    EMPTY, FULL_BOARD, IS_WINNING, MOVES_FOR, MOVE_BITS, SearchState, board_to_bits, book_move,
+    find_best_move, reachable_positions, transposition_table, _best_moves_bits,
+)
+from bench_engine import compare, git_commit, percentiles
+from nk_engine import MAX_BUDGET_MS, find_best_move_nk, nk_transposition_table
+
+SYMBOL_ASSIGNMENTS = (('X', 'O'), ('O', 'X')) # (AI, opponent)
+
+# Timings checked by --compare: (path in the results, True if higher is better).
+TRACKED_METRICS = (
+    (("timing_ms", "cold", "all", "p50"), False),
+    (("timing_ms", "cold", "all", "p99"), False),
+    (("timing_ms", "warm", "all", "p50"), False),
+    (("timing_ms", "warm", "all", "p99"), False),
+    (("timing_ms", "book", "all", "p50"), False),
+)
+
+# --- Reference solve ---
+reference_nodes = 0
+
+def reference_value(me, opp, depth):
+    """Score for the side to move (`me`) on the engine's scale (10 - depth
+    for a win, depth - 10 for a loss, 0 for a tie), by visiting every line of
+    play to the end."""
+    global reference_nodes
+    reference_nodes += 1
+    if IS_WINNING[me]:
+        return 10 - depth
+    if IS_WINNING[opp]:
+        return depth - 10
+    empty = FULL_BOARD & ~(me | opp)
+    if not empty:
+        return 0
+    return max(-reference_value(opp, me | MOVE_BITS[move_idx], depth + 1) for move_idx in MOVES_FOR[empty])
+
+def reference_solve(ai_bits, opp_bits):
+    """Returns (best_score, sorted best moves) for the AI to move, scored as
+    `find_best_move` scores its root moves."""
+    scores = {move_idx: -reference_value(opp_bits, ai_bits | MOVE_BITS[move_idx], 0)
+              for move_idx in MOVES_FOR[FULL_BOARD & ~(ai_bits | opp_bits)]}
+    best_score = max(scores.values())
+    return best_score, sorted(m for m, s in scores.items() if s == best_score)
+
+# --- Verification ---
+def _board_text(board):
+    return ''.join(spot if spot != EMPTY else '.' for spot in board)
+
+def _case_rng(seed, ai_symbol, board):
+    return random.Random(f"{seed}:{ai_symbol}:{_board_text(board)}")
+
+def verify_mode(mode, cases, references, seed, failures, repeats=1):
+    """Runs one setting over `cases` ([(ai, opponent, board), ...]) and
+    appends any failures. Returns (call times in ms by ply, {case: chosen move}).
+
+    The sweep is run `repeats` times from the same starting state (same
+    table, same tie-breaking) and each position keeps its fastest time,
+    which filters out most scheduling noise.
+    """
+    best_ms = [float('inf')] * len(cases)
+    chosen = {}
+    for repeat in range(repeats):
+        if mode == 'warm':
+            transposition_table.clear()
+        for index, (ai_symbol, opp_symbol, board) in enumerate(cases):
+            ai_bits, opp_bits = board_to_bits(board, ai_symbol), board_to_bits(board, opp_symbol)
+            ref_score, ref_moves = references[ai_bits, opp_bits]
+            if mode == 'cold':
+                transposition_table.clear()
+            rng = _case_rng(seed, ai_symbol, board)
+            start = time.perf_counter()
+            if mode == 'book':
+                move = book_move(board, ai_symbol, opp_symbol, rng)
+            else:
+                move = find_best_move(board, ai_symbol, opp_symbol, rng, use_book=False)
+            best_ms[index] = min(best_ms[index], (time.perf_counter() - start) * 1000)
+            chosen[ai_symbol, tuple(board)] = move
+
+            problem = None
+            if move not in ref_moves:
+                problem = f"chose {move}"
+            elif mode != 'book':
+                score, moves = _best_moves_bits(ai_bits, opp_bits, SearchState())
+                if (score, sorted(moves)) != (ref_score, ref_moves):
+                    problem = f"reports moves {sorted(moves)} scoring {score}"
+            if problem and repeat == 0:
+                failures.append({"mode": mode, "ai_symbol": ai_symbol, "board": _board_text(board),
+                                 "problem": problem, "best_moves": ref_moves, "best_score": ref_score})
+
+    by_ply = {}
+    for (_ai, _opp, board), ms in zip(cases, best_ms):
+        by_ply.setdefault(9 - board.count(EMPTY), []).append(ms)
+    return by_ply, chosen
+
+def verify_nk(cases, references, seed, failures):
+    """Runs the N x N engine over `cases` with one shared table and appends
+    any failures. Returns call times in ms by ply. Its tie-breaking draws
+    differ from the classic engine's, so it is left out of the determinism
+    check."""
+    nk_transposition_table.clear()
+    by_ply = {}
+    for ai_symbol, opp_symbol, board in cases:
+        ref_score, ref_moves = references[board_to_bits(board, ai_symbol), board_to_bits(board, opp_symbol)]
+        start = time.perf_counter()
+        result = find_best_move_nk(board, ai_symbol, opp_symbol, 3, 3, budget_ms=MAX_BUDGET_MS,
+                                   rng=_case_rng(seed, ai_symbol, board))
+        by_ply.setdefault(9 - board.count(EMPTY), []).append((time.perf_counter() - start) * 1000)
+        problem = None
+        if result.move not in ref_moves:
+            problem = f"chose {result.move} at depth {result.depth}"
+        elif not result.complete:
+            problem = f"did not finish within {MAX_BUDGET_MS:g} ms"
+        if problem:
+            failures.append({"mode": "nk", "ai_symbol": ai_symbol, "board": _board_text(board),
+                             "problem": problem, "best_moves": ref_moves, "best_score": ref_score})
+    return by_ply
+
+def verify(seed=0, repeats=3):
+    """Checks every reachable position in every setting. Returns the results
+    (JSON-serializable), with a list of failures that is empty on success."""
+    cases = [(ai, opp, board) for ai, opp in SYMBOL_ASSIGNMENTS for board in reachable_positions(ai, opp)]
+    references = {}
+    start = time.perf_counter()
+    for ai_symbol, opp_symbol, board in cases:
+        key = (board_to_bits(board, ai_symbol), board_to_bits(board, opp_symbol))
+        if key not in references: # Both assignments give the same bitboards
+            references[key] = reference_solve(*key)
+    reference_seconds = time.perf_counter() - start
+
+    failures = []
+    timings = {}
+    chosen = {}
+    timings["cold"], chosen["cold"] = verify_mode('cold', cases, references, seed, failures, repeats)
+    shuffled = list(cases)
+    random.Random(seed).shuffle(shuffled)
+    timings["warm"], chosen["warm"] = verify_mode('warm', shuffled, references, seed, failures, repeats)
+    if engine.OPENING_BOOK is not None:
+        timings["book"], chosen["book"] = verify_mode('book', cases, references, seed, failures, repeats)
+    timings["nk"] = verify_nk(shuffled, references, seed, failures)
+    for ai_symbol, opp_symbol, board in cases:
+        moves = {mode: chosen[mode][ai_symbol, tuple(board)] for mode in chosen}
+        if len(set(moves.values())) > 1:
+            ai_bits, opp_bits = board_to_bits(board, ai_symbol), board_to_bits(board, opp_symbol)
+            ref_score, ref_moves = references[ai_bits, opp_bits]
+            failures.append({"mode": "determinism", "ai_symbol": ai_symbol, "board": _board_text(board),
+                             "problem": f"same seed chose {moves}", "best_moves": ref_moves, "best_score": ref_score})
+
+    report = {}
+    for mode, plies in timings.items():
+        report[mode] = {"all": percentiles([ms for samples in plies.values() for ms in samples])}
+        report[mode]["by_ply"] = {str(ply): percentiles(samples) for ply, samples in sorted(plies.items())}
+    return {
+        "positions": len(cases),
+        "modes": list(timings),
+        "seed": seed,
+        "repeats": repeats,
+        "reference": {"positions": len(references), "nodes": reference_nodes,
+                      "seconds": round(reference_seconds, 4)},
+        "timing_ms": report,
+        "failures": failures,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the classic engine's moves in every reachable position.")
+    parser.add_argument('--output', default='verify_results.json', help="Where to write the JSON results.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for tie-breaking and the warm sweep's order.")
+    parser.add_argument('--repeats', type=int, default=3,
+                        help="Sweeps per setting; each position keeps its fastest time (default: 3).")
+    parser.add_argument('--compare', help="Baseline results JSON to check the timings against.")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed relative slowdown before --compare fails (default: 0.25).")
+    parser.add_argument('--show', type=int, default=20, help="Failures to print (default: 20).")
+    args = parser.parse_args()
+    if args.repeats < 1:
+        parser.error("--repeats must be at least 1")
+
+    print(f"Verifying every reachable position for AI 'X' and AI 'O' (opening book "
+          f"{'loaded' if engine.OPENING_BOOK is not None else 'not loaded, skipping book checks'})...")
+    results = {"meta": {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z')}}
+    results.update(verify(args.seed, args.repeats))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    reference = results["reference"]
+    print(f"Reference: {reference['positions']} positions solved in {reference['seconds']}s "
+          f"({reference['nodes']:,} nodes, no pruning or caching)")
+    for mode, report in results["timing_ms"].items():
+        print(f"{mode}: {report['all']['count']} positions, p50 {report['all']['p50']} ms, "
+              f"p99 {report['all']['p99']} ms, max {report['all']['max']} ms")
+    print(f"Results written to {args.output}")
+
+    status = 0
+    failures = results["failures"]
+    for failure in failures[:args.show]:
+        print(f"FAIL [{failure['mode']}] AI {failure['ai_symbol']} on {failure['board']}: {failure['problem']}, "
+              f"best is {failure['best_moves']} scoring {failure['best_score']}")
+    if failures:
+        print(f"{len(failures)} failure(s) over {results['positions']} positions.")
+        status = 1
+    else:
+        print(f"All moves optimal over {results['positions']} positions in {len(results['modes'])} settings.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, TRACKED_METRICS)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            status = 1
+        else:
+            print(f"No timing regressions against {args.compare} (tolerance {args.tolerance:.0%}).")
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+# api_server/wire.py
+# Compact binary wire format for /predict_move and /predict_moves, an
+# alternative to JSON chosen by content negotiation (Content-Type and Accept:
+# application/x-tictactoe). All integers are little-endian.
+#
+# Request (one game), 7 bytes plus two bitboards of ceil(N*N / 8) bytes each
+# (11 bytes for 3x3):
+#   u8 version | u8 board_size | u8 win_length | ai symbol byte |
+#   opponent symbol byte | u16 budget_ms (0 = default) | ai stones | opponent stones
+# Bit r * N + c of a bitboard is cell (r, c), i.e. the board index.
+#
+# Response (one game), 3 bytes:
+#   u8 status (0 success, 1 game already over, 2 error) |
+#   u8 AI move (255 = none) | u8 winner (0 none, 1 AI, 2 opponent, 3 tie)
+# A single-game error response is followed by the UTF-8 error message.
+#
+# Batch request:  u16 count | count requests
+# Batch response: u16 count | count 3-byte responses (errors carry no message)
+import struct
+from collections import namedtuple
+
+from nk_engine import MIN_BOARD_SIZE, MAX_BOARD_SIZE, MAX_BUDGET_MS
+
+BINARY_MIMETYPE = 'application/x-tictactoe'
+WIRE_VERSION = 1
+REQUEST_HEADER = struct.Struct('<BBBccH') # version, board_size, win_length, ai symbol, opponent symbol, budget_ms
+RESPONSE = struct.Struct('<BBB')          # status, move, winner
+BATCH_COUNT = struct.Struct('<H')
+
+STATUS_SUCCESS, STATUS_GAME_OVER, STATUS_ERROR = 0, 1, 2
+WINNER_NONE, WINNER_AI, WINNER_OPPONENT, WINNER_TIE = 0, 1, 2, 3
+NO_MOVE = 255
+
+BinaryRequest = namedtuple('BinaryRequest', ['board_size', 'win_length', 'ai_symbol', 'opponent_symbol',
+                                             'budget_ms', 'ai_bits', 'opp_bits'])
+
+class WireFormatError(ValueError):
+    """Raised for a binary message that cannot be decoded."""
+
+def board_bytes(board_size):
+    return (board_size * board_size + 7) // 8
+
+# --- Requests ---
+def encode_request(board, ai_symbol, opponent_symbol, board_size=3, win_length=None, budget_ms=None):
+    """Encodes a /predict_move request (a list board, as in the JSON format)."""
+    ai_bits = sum(1 << i for i, spot in enumerate(board) if spot == ai_symbol)
+    opp_bits = sum(1 << i for i, spot in enumerate(board) if spot == opponent_symbol)
+    size = board_bytes(board_size)
+    try:
+        header = REQUEST_HEADER.pack(WIRE_VERSION, board_size, board_size if win_length is None else win_length,
+                                     ai_symbol.encode('ascii'), opponent_symbol.encode('ascii'), round(budget_ms or 0))
+    except (struct.error, UnicodeEncodeError) as e:
+        raise WireFormatError(f"Cannot encode request: {e}") from e
+    return header + ai_bits.to_bytes(size, 'little') + opp_bits.to_bytes(size, 'little')
+
+def decode_request(data, offset=0):
+    """Decodes one request at `offset`. Returns (request, next_offset), where
+    request is a BinaryRequest or, for a well-formed message describing an
+    invalid game, a WireFormatError to report for that game only. Raises
+    WireFormatError if the bytes cannot be parsed at all."""
+    if len(data) - offset < REQUEST_HEADER.size:
+        raise WireFormatError("Truncated request header.")
+    version, board_size, win_length, ai_symbol, opponent_symbol, budget_ms = REQUEST_HEADER.unpack_from(data, offset)
+    if version != WIRE_VERSION:
+        raise WireFormatError(f"Unsupported wire format version {version}; expected {WIRE_VERSION}.")
+    size = board_bytes(board_size)
+    start = offset + REQUEST_HEADER.size
+    end = start + 2 * size
+    if len(data) < end:
+        raise WireFormatError("Truncated request board.")
+    ai_bits = int.from_bytes(data[start:start + size], 'little')
+    opp_bits = int.from_bytes(data[start + size:end], 'little')
+
+    if not MIN_BOARD_SIZE <= board_size <= MAX_BOARD_SIZE:
+        return WireFormatError(f"Invalid board_size. Must be from {MIN_BOARD_SIZE} to {MAX_BOARD_SIZE}."), end
+    if not MIN_BOARD_SIZE <= win_length <= board_size:
+        return WireFormatError(f"Invalid win_length. Must be from {MIN_BOARD_SIZE} to board_size."), end
+    if budget_ms > MAX_BUDGET_MS:
+        return WireFormatError(f"Invalid budget_ms. Must be at most {MAX_BUDGET_MS:g}."), end
+    if ai_symbol == opponent_symbol:
+        return WireFormatError("ai_symbol and opponent_symbol cannot be the same."), end
+    if ai_bits & opp_bits or (ai_bits | opp_bits) >> (board_size * board_size):
+        return WireFormatError("Invalid board. Cells must be taken by at most one player and be on the board."), end
+    return BinaryRequest(board_size, win_length, ai_symbol.decode('latin-1'), opponent_symbol.decode('latin-1'),
+                         budget_ms or None, ai_bits, opp_bits), end
+
+def decode_single_request(data):
+    request, end = decode_request(data)
+    if end != len(data):
+        raise WireFormatError("Unexpected bytes after the request.")
+    return request
+
+def encode_batch_request(items):
+    """Encodes /predict_moves items given as JSON-style dicts."""
+    parts = [BATCH_COUNT.pack(len(items))]
+    for item in items:
+        parts.append(encode_request(item['board'], item['ai_symbol'], item['opponent_symbol'],
+                                    item.get('board_size', 3), item.get('win_length'), item.get('budget_ms')))
+    return b''.join(parts)
+
+def decode_batch_request(data):
+    """Returns the batch's requests (BinaryRequest or WireFormatError each)."""
+    if len(data) < BATCH_COUNT.size:
+        raise WireFormatError("Truncated batch header.")
+    (count,) = BATCH_COUNT.unpack_from(data)
+    offset = BATCH_COUNT.size
+    requests = []
+    for _ in range(count):
+        request, offset = decode_request(data, offset)
+        requests.append(request)
+    if offset != len(data):
+        raise WireFormatError("Unexpected bytes after the batch.")
+    return requests
+
+def request_to_json(request):
+    """The JSON-format body for a decoded request, for the JSON code path."""
+    cells = request.board_size * request.board_size
+    board = [request.ai_symbol if request.ai_bits >> i & 1 else request.opponent_symbol if request.opp_bits >> i & 1
+             else ' ' for i in range(cells)]
+    data = {"board": board, "ai_symbol": request.ai_symbol, "opponent_symbol": request.opponent_symbol,
+            "board_size": request.board_size, "win_length": request.win_length}
+    if request.budget_ms is not None:
+        data["budget_ms"] = request.budget_ms
+    return data
+
+# --- Responses ---
+def encode_response(status, move=None, winner=WINNER_NONE, message=''):
+    data = RESPONSE.pack(status, NO_MOVE if move is None else move, winner)
+    return data + message.encode('utf-8') if message else data
+
+def decode_response(data):
+    """Returns (status, move or None, winner, error message)."""
+    status, move, winner = RESPONSE.unpack_from(data)
+    return status, None if move == NO_MOVE else move, winner, bytes(data[RESPONSE.size:]).decode('utf-8')
+
+def encode_batch_response(codes):
+    """Encodes [(status, move, winner), ...]."""
+    return BATCH_COUNT.pack(len(codes)) + b''.join(RESPONSE.pack(status, NO_MOVE if move is None else move, winner)
+                                                   for status, move, winner in codes)
+
+def decode_batch_response(data):
+    """Returns [(status, move or None, winner), ...]."""
+    (count,) = BATCH_COUNT.unpack_from(data)
+    results = []
+    for status, move, winner in RESPONSE.iter_unpack(data[BATCH_COUNT.size:BATCH_COUNT.size + count * RESPONSE.size]):
+        results.append((status, None if move == NO_MOVE else move, winner))
+    return results
+
+def result_codes(result, ai_symbol=None, opponent_symbol=None):
+    """(status, move, winner) for a JSON-format /predict_move result."""
+    if "error" in result:
+        return STATUS_ERROR, None, WINNER_NONE
+    winner = result.get("winner")
+    if winner is None:
+        winner_code = WINNER_NONE
+    elif winner == "tie":
+        winner_code = WINNER_TIE
+    elif winner == ai_symbol:
+        winner_code = WINNER_AI
+    else:
+        winner_code = WINNER_OPPONENT
+    status = STATUS_GAME_OVER if result.get("status") == "game_over" else STATUS_SUCCESS
+    return status, result.get("ai_move_index"), winner_code
@@ -1,16 +1,71 @@
 # client_app/client_app.py
 from flask import Flask, render_template, request, redirect, url_for, session, flash
 import requests # To make requests to your API
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import sys
 
 app = Flask(__name__)
 # It's good practice to set the secret key from an environment variable
 # For development, you can use a hardcoded string, but change it for production
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'a_very_secure_default_secret_key_for_dev')
 
-API_BASE_URL = "http://127.0.0.1:5000" # Your API server address
+API_BASE_URL = os.environ.get('TTT_API_BASE_URL', "http://127.0.0.1:5000") # Your API server address
 EMPTY_CELL = ' ' # Consistent with your API
 
+# --- API Client Configuration ---
+# 'http' calls the API server; 'inprocess' runs the engine inside this app
+# (use it when both apps are deployed together to skip the network hop).
+ENGINE_MODE = os.environ.get('TTT_ENGINE_MODE', 'http')
+API_POOL_SIZE = int(os.environ.get('TTT_API_POOL_SIZE', 10))             # Keep-alive connections kept open
+API_CONNECT_TIMEOUT = float(os.environ.get('TTT_API_CONNECT_TIMEOUT', 3)) # Seconds
+API_READ_TIMEOUT = float(os.environ.get('TTT_API_READ_TIMEOUT', 10))      # Seconds
+API_RETRIES = int(os.environ.get('TTT_API_RETRIES', 3))
+API_RETRY_BACKOFF = float(os.environ.get('TTT_API_RETRY_BACKOFF', 0.2))   # Seconds, doubled on each retry
+
+def create_api_session():
+    """Returns a requests Session that reuses pooled keep-alive connections to the API.
+
+    Failed connections and 502/503/504 responses are retried with exponential
+    backoff. /predict_move has no side effects, so retrying the POST is safe.
+    """
+    retry = Retry(
+        total=API_RETRIES,
+        backoff_factor=API_RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'POST']),
+        raise_on_status=False, # Hand the last response to raise_for_status()
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+    api_session = requests.Session()
+    api_session.mount('http://', adapter)
+    api_session.mount('https://', adapter)
+    return api_session
+
+api_session = create_api_session()
+_in_process_predict = None
+
+def request_ai_move(api_payload):
+    """Asks the engine for the AI's move and returns the /predict_move response data.
+
+    Raises requests.exceptions.RequestException if the API cannot be reached.
+    """
+    global _in_process_predict
+    if ENGINE_MODE == 'inprocess':
+        if _in_process_predict is None:
+            # The engine ships next to this app in ../api_server
+            sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api_server'))
+            from app import predict_move_result
+            _in_process_predict = predict_move_result
+        api_data, _status_code = _in_process_predict(api_payload)
+        return api_data
+
+    response = api_session.post(f"{API_BASE_URL}/predict_move", json=api_payload,
+                                timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+    response.raise_for_status() # Raise an exception for HTTP errors
+    return response.json()
+
 # --- Helper Functions ---
 def check_local_winner(board, player):
     win_conditions = [
@@ -111,9 +166,7 @@ def ai_turn_handler():
     }
 
     try:
-        response = requests.post(f"{API_BASE_URL}/predict_move", json=api_payload, timeout=10)
-        response.raise_for_status() # Raise an exception for HTTP errors
-        api_data = response.json()
+        api_data = request_ai_move(api_payload)
 
         if api_data.get("error"):
             flash(f"API Error: {api_data['error']}", "error")